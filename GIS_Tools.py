@@ -0,0 +1,699 @@
+################################################################
+## raster input and output for the EcoGIS tools
+## nothing here needs Qt or QGIS, so the analysis can be run without a
+## display (see __main__.py), the dialogs get these through UI_Tools
+################################################################
+
+from osgeo import gdal
+from collections import OrderedDict
+import cPickle
+import os
+from numpy import float64, isnan, logical_not, where, arange, floor, clip, minimum, zeros, ix_, histogram
+from numpy import asarray, empty, nan, memmap, int64, argsort, bincount, cumsum, concatenate
+from numpy import nonzero, diff, full, maximum, fmin, fmax, fromstring, integer
+from tempfile import TemporaryFile, mkstemp
+from threading import Lock
+
+################################################################
+## raised to stop an analysis part way through
+## the analysis functions take a progress(done, total) callback which
+## they call as they go, the callback raises this to cancel the run
+class analysisCancelled(Exception):
+  pass
+
+################################################################
+## class to read a raster band into numpy arrays
+## give it a raster layer (or the path to a raster file) and a band
+## number counted from 0, as returned by rasterLayerSelect.getSelected()
+## a whole band, or any window of it, is fetched with a single call to
+## the gdal provider rather than one identify() call per pixel
+## read() returns [values, mask] where values is a float array
+## (rows run from the top of the layer) and mask is True where the
+## pixel holds data, i.e. it is not the nodata value or NaN
+## strips() reads the band a few rows at a time for large grids
+class rasterBandReader:
+
+  # largest number of pixels to hold in memory for each strip
+  StripCells=4194304
+
+  def __init__(self, layer, band):
+
+    # accept either a qgis layer or a file name
+    if hasattr(layer, "source"):
+      self.source=str(layer.source())
+    else:
+      self.source=str(layer)
+    self.band=band
+
+    self.dataset=gdal.Open(self.source, gdal.GA_ReadOnly)
+    if self.dataset is None:
+      raise IOError("Unable to open raster %s" %self.source)
+    # gdal counts bands from 1
+    self.gdalBand=self.dataset.GetRasterBand(band+1)
+    self.noData=self.gdalBand.GetNoDataValue()
+
+    # grid dimensions and cell size
+    self.width=self.dataset.RasterXSize
+    self.height=self.dataset.RasterYSize
+    myTransform=self.dataset.GetGeoTransform()
+    self.xMin=myTransform[0]
+    self.yMax=myTransform[3]
+    self.xSize=myTransform[1]
+    self.ySize=abs(myTransform[5])
+    self.xMax=self.xMin+(self.width*self.xSize)
+    self.yMin=self.yMax-(self.height*self.ySize)
+
+  ################################################################
+  # read a window of the band, by default the whole band
+  def read(self, xOff=0, yOff=0, xCount=None, yCount=None):
+
+    if xCount is None:
+      xCount=self.width-xOff
+    if yCount is None:
+      yCount=self.height-yOff
+
+    myValues=self.gdalBand.ReadAsArray(xOff, yOff, xCount, yCount).astype(float64)
+
+    # build the nodata mask numerically
+    myMask=logical_not(isnan(myValues))
+    if self.noData is not None:
+      myMask&=(myValues!=self.noData)
+
+    return [myValues, myMask]
+
+  ################################################################
+  # read the band in strips of whole rows so that memory use depends
+  # on the strip size rather than the size of the raster
+  # halo extra rows above and below each strip are included for
+  # neighbourhood calculations
+  # yields [values, mask, yStart, yStop, first] where rows yStart to
+  # yStop of the band are found at values[first:first+yStop-yStart]
+  def strips(self, halo=0, maxCells=None):
+
+    if maxCells is None:
+      maxCells=self.StripCells
+    myRows=max(1, maxCells//self.width)
+
+    for yStart in range(0, self.height, myRows):
+      yStop=min(yStart+myRows, self.height)
+      # add the halo, clipped to the edge of the layer
+      yFrom=max(0, yStart-halo)
+      yTo=min(self.height, yStop+halo)
+      [myValues, myMask]=self.read(0, yFrom, self.width, yTo-yFrom)
+      yield [myValues, myMask, yStart, yStop, yStart-yFrom]
+
+  ################################################################
+  # summary statistics of the band, from the shared statistics cache
+  # (see rasterStatsCache)
+  def statistics(self):
+    return bandStatistics(self)
+
+################################################################
+## class to read a raster band on the grid of another raster
+## give it a rasterBandReader for the layer and one for the reference
+## layer which defines the grid (both in the same coordinate system)
+## the centre of each reference pixel is found on the layer grid once,
+## as an array of columns and an array of rows, and only the window of
+## the layer covering the requested reference pixels is read
+## values are taken from the nearest pixel, or interpolated from the
+## 4 nearest pixel centres with bilinear=True
+## read() and strips() work as for rasterBandReader but on the
+## reference grid, pixels beyond the edge of the layer are masked out
+class alignedBandReader(rasterBandReader):
+
+  def __init__(self, reader, reference, bilinear=False):
+
+    self.reader=reader
+    self.bilinear=bilinear
+    self.source=reader.source
+    self.band=reader.band
+    self.noData=reader.noData
+
+    # take the grid of the reference layer
+    self.width=reference.width
+    self.height=reference.height
+    self.xMin=reference.xMin
+    self.yMax=reference.yMax
+    self.xSize=reference.xSize
+    self.ySize=reference.ySize
+    self.xMax=reference.xMax
+    self.yMin=reference.yMin
+
+    # columns and rows of the layer under each reference pixel centre
+    self.cols=self.alignAxis(self.width, self.xMin-reader.xMin, self.xSize,
+                             reader.xSize, reader.width)
+    self.rows=self.alignAxis(self.height, reader.yMax-self.yMax, self.ySize,
+                             reader.ySize, reader.height)
+
+  ################################################################
+  # the statistics of the layer only hold for the reference grid if the
+  # grids are the same, otherwise None
+  def statistics(self):
+    myReader=self.reader
+    if [myReader.width, myReader.height, myReader.xMin, myReader.yMax, myReader.xSize, myReader.ySize]== \
+          [self.width, self.height, self.xMin, self.yMax, self.xSize, self.ySize]:
+      return myReader.statistics()
+    return None
+
+  ################################################################
+  # position of the reference pixel centres along one axis of the layer
+  # start is the distance from the edge of the layer to the edge of
+  # the reference grid
+  # returns [first, second, weight, valid] where first and second are
+  # the layer pixels to use (the same pixel for nearest neighbour),
+  # weight is the share of the second and valid marks the reference
+  # pixels that fall within the layer
+  def alignAxis(self, count, start, size, layerSize, layerCount):
+
+    myPosition=(start+(arange(count)+0.5)*size)/layerSize
+    myValid=(myPosition>=0) & (myPosition<layerCount)
+
+    if self.bilinear:
+      # measure from the first pixel centre, holding the edge pixels
+      # constant out to the edge of the layer
+      myPosition=clip(myPosition-0.5, 0, layerCount-1)
+      myFirst=minimum(floor(myPosition), max(layerCount-2, 0)).astype(int)
+      mySecond=minimum(myFirst+1, layerCount-1)
+      myWeight=myPosition-myFirst
+    else:
+      myFirst=clip(floor(myPosition), 0, layerCount-1).astype(int)
+      mySecond=myFirst
+      myWeight=zeros(count)
+
+    return [myFirst, mySecond, myWeight, myValid]
+
+  ################################################################
+  # read a window of the reference grid from the layer
+  def read(self, xOff=0, yOff=0, xCount=None, yCount=None):
+
+    if xCount is None:
+      xCount=self.width-xOff
+    if yCount is None:
+      yCount=self.height-yOff
+
+    [myCol1, myCol2, myColWeight, myColValid]=[a[xOff:xOff+xCount] for a in self.cols]
+    [myRow1, myRow2, myRowWeight, myRowValid]=[a[yOff:yOff+yCount] for a in self.rows]
+
+    myValues=zeros((yCount, xCount))
+    myMask=zeros((yCount, xCount), dtype=bool)
+    if not (myColValid.any() and myRowValid.any()):
+      return [myValues, myMask]
+
+    # only read the overlapping window of the layer
+    xFrom=int(myCol1[myColValid].min())
+    xTo=int(myCol2[myColValid].max())+1
+    yFrom=int(myRow1[myRowValid].min())
+    yTo=int(myRow2[myRowValid].max())+1
+    [myWindow, myWindowMask]=self.reader.read(xFrom, yFrom, xTo-xFrom, yTo-yFrom)
+
+    # indices into the window, those outside the layer are masked below
+    [myCol1, myCol2]=[clip(a-xFrom, 0, xTo-xFrom-1) for a in [myCol1, myCol2]]
+    [myRow1, myRow2]=[clip(a-yFrom, 0, yTo-yFrom-1) for a in [myRow1, myRow2]]
+    myMask[:]=myRowValid[:,None] & myColValid[None,:]
+
+    if self.bilinear:
+      wx=myColWeight[None,:]
+      wy=myRowWeight[:,None]
+      myCorners=[[ix_(myRow1, myCol1), (1-wy)*(1-wx)],
+                 [ix_(myRow1, myCol2), (1-wy)*wx],
+                 [ix_(myRow2, myCol1), wy*(1-wx)],
+                 [ix_(myRow2, myCol2), wy*wx]]
+      # a corner with no weight doesn't need to hold data
+      for [myCorner, myWeight] in myCorners:
+        myMask&=myWindowMask[myCorner] | (myWeight==0)
+      for [myCorner, myWeight] in myCorners:
+        myValues+=myWeight*where(myMask & myWindowMask[myCorner], myWindow[myCorner], 0.0)
+    else:
+      myMask&=myWindowMask[ix_(myRow1, myCol1)]
+      myValues[:]=myWindow[ix_(myRow1, myCol1)]
+
+    return [myValues, myMask]
+
+################################################################
+## class to look up the values of a raster band at many points
+## give it a rasterBandReader, the band is read once into an array with
+## NaN for the pixels with no data, so each lookup is just indexing
+## bands of more than MemoryCells pixels are copied a strip at a time
+## into a memory mapped temporary file rather than held in memory
+## valueAt(x, y) looks up one point, valuesAt() takes arrays
+## valueBins() groups the cells by value, see below
+class rasterSampler:
+
+  MemoryCells=25000000
+  # rows of the band worked on at a time by valueBins
+  StripRows=1024
+
+  def __init__(self, reader):
+
+    self.source=reader.source
+    self.band=reader.band
+    self.width=reader.width
+    self.height=reader.height
+    self.xMin=reader.xMin
+    self.yMax=reader.yMax
+    self.xSize=reader.xSize
+    self.ySize=reader.ySize
+    self.xMax=reader.xMax
+    self.yMin=reader.yMin
+
+    if self.width*self.height>self.MemoryCells:
+      # removed by the system when it is closed
+      self.values=memmap(TemporaryFile(), dtype=float64, mode="w+",
+                         shape=(self.height, self.width))
+    else:
+      self.values=empty((self.height, self.width))
+    for [myValues, myMask, yStart, yStop, first] in reader.strips():
+      myValues=myValues[first:first+yStop-yStart]
+      myMask=myMask[first:first+yStop-yStart]
+      self.values[yStart:yStop]=where(myMask, myValues, nan)
+    # worked out when first needed
+    self.bins={}
+
+  ################################################################
+  # values of the pixels under the points x,y (sequences or arrays)
+  # returns [values, valid] where valid is False for points out of the
+  # extent of the layer or on pixels with no data, their values are NaN
+  def valuesAt(self, x, y):
+
+    myCols=floor((asarray(x, dtype=float)-self.xMin)/self.xSize)
+    myRows=floor((self.yMax-asarray(y, dtype=float))/self.ySize)
+    myValid=(myCols>=0) & (myRows>=0) & (myCols<self.width) & (myRows<self.height)
+
+    myValues=self.values[clip(myRows, 0, self.height-1).astype(int),
+                         clip(myCols, 0, self.width-1).astype(int)]
+    myValues=where(myValid, myValues, nan)
+    return [myValues, myValid & logical_not(isnan(myValues))]
+
+  ################################################################
+  # value of the pixel under the point x,y, None if the point is out of
+  # the extent of the layer or the pixel has no data
+  def valueAt(self, x, y):
+
+    myCol=int(floor((x-self.xMin)/self.xSize))
+    myRow=int(floor((self.yMax-y)/self.ySize))
+    if myCol<0 or myRow<0 or myCol>=self.width or myRow>=self.height:
+      return None
+
+    myValue=float(self.values[myRow, myCol])
+    if isnan(myValue):
+      return None
+    return myValue
+
+  ################################################################
+  # the cells holding data grouped into equal bins from the lowest to
+  # the highest value (as the histogram of rasterStatsCache), kept for
+  # later calls with the same number of bins
+  # returns [low, high, starts, cells] where cells are the flat indices
+  # (row*width+col) of the cells in bin order, those of bin b being
+  # cells[starts[b]:starts[b+1]], and low and high are the least and
+  # greatest values found in each bin (NaN for an empty bin)
+  def valueBins(self, bins=256):
+
+    if bins in self.bins:
+      return self.bins[bins]
+
+    myStrips=[[yStart, min(yStart+self.StripRows, self.height)]
+              for yStart in range(0, self.height, self.StripRows)]
+    # range of the values
+    [myMin, myMax]=[None, None]
+    for [yStart, yStop] in myStrips:
+      myValues=self.values[yStart:yStop]
+      myValues=myValues[logical_not(isnan(myValues))]
+      if len(myValues):
+        myMin=min(float(myValues.min()), myMin) if myMin is not None else float(myValues.min())
+        myMax=max(float(myValues.max()), myMax) if myMax is not None else float(myValues.max())
+
+    # count the cells in each bin, then place them strip by strip
+    myCounts=zeros(bins, dtype=int64)
+    for [myBins, myFlat, myValues] in self.binStrips(myStrips, myMin, myMax, bins):
+      myCounts+=bincount(myBins, minlength=bins)
+    myStarts=concatenate([[0], cumsum(myCounts)])
+    if myStarts[-1]>self.MemoryCells:
+      myCells=memmap(TemporaryFile(), dtype=int64, mode="w+", shape=(int(myStarts[-1]),))
+    else:
+      myCells=empty(myStarts[-1], dtype=int64)
+    [myLow, myHigh]=[full(bins, nan), full(bins, nan)]
+    myFill=myStarts[:-1].copy()
+    for [myBins, myFlat, myValues] in self.binStrips(myStrips, myMin, myMax, bins):
+      if len(myBins)==0:
+        continue
+      # the order within a bin doesn't matter
+      myOrder=argsort(myBins)
+      [myBins, myFlat, myValues]=[myBins[myOrder], myFlat[myOrder], myValues[myOrder]]
+      # where each bin starts in the strip, and each cell's place in it
+      myFirst=concatenate([[0], nonzero(diff(myBins))[0]+1])
+      myGroup=cumsum(concatenate([[0], diff(myBins)!=0]))
+      myCells[myFill[myBins]+arange(len(myBins))-myFirst[myGroup]]=myFlat
+      myFill+=bincount(myBins, minlength=bins)
+      # range of the values in each bin
+      myStripBins=myBins[myFirst]
+      myLow[myStripBins]=fmin(myLow[myStripBins], minimum.reduceat(myValues, myFirst))
+      myHigh[myStripBins]=fmax(myHigh[myStripBins], maximum.reduceat(myValues, myFirst))
+    self.bins[bins]=[myLow, myHigh, myStarts, myCells]
+    return self.bins[bins]
+
+  ################################################################
+  # the cells holding data in each strip of rows as [bins, flat
+  # indices, values], for valueBins
+  def binStrips(self, strips, low, high, bins):
+    for [yStart, yStop] in strips:
+      myValues=self.values[yStart:yStop].ravel()
+      myFlat=nonzero(logical_not(isnan(myValues)))[0]
+      myValues=myValues[myFlat]
+      if high>low:
+        myBins=clip(floor((myValues-low)/(high-low)*bins), 0, bins-1).astype(int64)
+      else:
+        myBins=zeros(len(myValues), dtype=int64)
+      yield [myBins, myFlat+yStart*self.width, myValues]
+
+################################################################
+## class to keep summary statistics of raster bands on disk so that an
+## unchanged band doesn't have to be read again to get them
+## entries are keyed on the layer file, band, file size and modification
+## time, so a band is read again if its file changes, and the least
+## recently used entries are dropped when there are more than MaxEntries
+## statistics(reader) takes a rasterBandReader and returns a dict of
+##   n, sum, sumSquares, min, max
+##   shift, moments: moments are [n, s1, s2, s3, s4] the sums of the
+##     powers of (value-shift), where shift is the first value in the
+##     band, to keep rounding errors down for the higher moments
+##   histogram: [counts, edges] for HistogramBins equal bins from min to max
+## min, max, shift and histogram are None for a band with no data
+## tools share one cache through bandStatistics(reader), it may be used
+## from several analysis threads at once: the entries are only touched
+## with the lock held, while a band is read through without it
+class rasterStatsCache:
+
+  CacheFile=os.path.join(os.path.expanduser("~"), ".ecogis", "bandstats.pickle")
+  MaxEntries=256
+  HistogramBins=256
+
+  def __init__(self, fileName=None):
+    if fileName is None:
+      fileName=self.CacheFile
+    self.fileName=fileName
+    self.lock=Lock()
+    self.entries=self.load()
+
+  ################################################################
+  # read the cache file, starting afresh if it is missing or unreadable
+  def load(self):
+    try:
+      myFile=open(self.fileName, "rb")
+      try:
+        myEntries=cPickle.load(myFile)
+      finally:
+        myFile.close()
+    except Exception:
+      myEntries=OrderedDict()
+    if not isinstance(myEntries, OrderedDict):
+      myEntries=OrderedDict()
+    return myEntries
+
+  ################################################################
+  # write the cache file, a cache that can't be written is just not kept
+  # called with the lock held
+  def save(self):
+    myTemp=None
+    try:
+      myDir=os.path.dirname(self.fileName)
+      if myDir and not os.path.isdir(myDir):
+        os.makedirs(myDir)
+      # write a copy and swap it in, so that readers never see half a file
+      # the copy has a name of its own, as other processes may be saving
+      [myHandle, myTemp]=mkstemp(prefix=os.path.basename(self.fileName)+".", dir=myDir or None)
+      myFile=os.fdopen(myHandle, "wb")
+      try:
+        cPickle.dump(self.entries, myFile, cPickle.HIGHEST_PROTOCOL)
+      finally:
+        myFile.close()
+      if os.name=="nt" and os.path.exists(self.fileName):
+        os.remove(self.fileName)
+      os.rename(myTemp, self.fileName)
+    except (IOError, OSError):
+      # don't leave a half written copy behind
+      try:
+        if myTemp and os.path.exists(myTemp):
+          os.remove(myTemp)
+      except OSError:
+        pass
+
+  ################################################################
+  # the cache key for a band, None if the source isn't a file
+  def key(self, reader):
+    try:
+      myPath=os.path.abspath(reader.source)
+      myStat=os.stat(myPath)
+    except (OSError, TypeError):
+      return None
+    return (myPath, reader.band, myStat.st_size, myStat.st_mtime)
+
+  ################################################################
+  # statistics for a band, calculated if they aren't in the cache
+  def statistics(self, reader):
+
+    myKey=self.key(reader)
+    if myKey is None:
+      return self.calculate(reader)
+
+    # pick up anything other tools have added since we loaded
+    self.lock.acquire()
+    try:
+      self.entries=self.load()
+      myStats=self.entries.get(myKey)
+    finally:
+      self.lock.release()
+
+    # other threads carry on while the band is read
+    if myStats is None:
+      myStats=self.calculate(reader)
+
+    self.lock.acquire()
+    try:
+      # move it to the end as the most recently used
+      self.entries.pop(myKey, None)
+      self.entries[myKey]=myStats
+      while len(self.entries)>self.MaxEntries:
+        self.entries.popitem(last=False)
+      self.save()
+    finally:
+      self.lock.release()
+
+    return myStats
+
+  ################################################################
+  # read through the band to get the statistics
+  # the histogram needs the range so takes a second pass
+  def calculate(self, reader):
+
+    myStats={"n": 0, "sum": 0.0, "sumSquares": 0.0, "min": None, "max": None,
+             "shift": None, "moments": [0, 0.0, 0.0, 0.0, 0.0], "histogram": None}
+    for [myValues, myMask, yStart, yStop, first] in reader.strips():
+      myValues=myValues[myMask]
+      if len(myValues)==0:
+        continue
+      if myStats["shift"] is None:
+        myStats["shift"]=float(myValues[0])
+        myStats["min"]=float(myValues.min())
+        myStats["max"]=float(myValues.max())
+      myStats["n"]+=len(myValues)
+      myStats["sum"]+=float(myValues.sum())
+      myStats["sumSquares"]+=float((myValues*myValues).sum())
+      myStats["min"]=min(myStats["min"], float(myValues.min()))
+      myStats["max"]=max(myStats["max"], float(myValues.max()))
+      myDev=myValues-myStats["shift"]
+      myDev2=myDev*myDev
+      myStats["moments"]=[a+b for [a, b] in zip(myStats["moments"],
+                          [len(myValues), float(myDev.sum()), float(myDev2.sum()),
+                           float((myDev2*myDev).sum()), float((myDev2*myDev2).sum())])]
+
+    if myStats["n"]>0:
+      myCounts=zeros(self.HistogramBins, dtype=int)
+      for [myValues, myMask, yStart, yStop, first] in reader.strips():
+        [myStripCounts, myEdges]=histogram(myValues[myMask], self.HistogramBins,
+                                           (myStats["min"], myStats["max"]))
+        myCounts+=myStripCounts
+      myStats["histogram"]=[myCounts, myEdges]
+
+    return myStats
+
+# the cache shared by all the tools, opened when first needed
+statsCache=None
+statsCacheLock=Lock()
+
+################################################################
+# statistics of a band read by a rasterBandReader, from the shared cache
+def bandStatistics(reader):
+  global statsCache
+  statsCacheLock.acquire()
+  try:
+    if statsCache is None:
+      statsCache=rasterStatsCache()
+  finally:
+    statsCacheLock.release()
+  return statsCache.statistics(reader)
+
+################################################################
+## class to write a multi-band raster on the same grid as the layer
+## read by a rasterBandReader, a strip of rows at a time
+## NaN values are written as noData
+class rasterWriter:
+
+  def __init__(self, fileName, template, bands, noData=-9999, format="GTiff"):
+    self.noData=noData
+    myDriver=gdal.GetDriverByName(format)
+    self.dataset=myDriver.Create(str(fileName), template.width, template.height,
+                                 bands, gdal.GDT_Float32)
+    if self.dataset is None:
+      raise IOError("Unable to create raster %s" %fileName)
+    self.dataset.SetGeoTransform(template.dataset.GetGeoTransform())
+    self.dataset.SetProjection(template.dataset.GetProjection())
+    for i in range(bands):
+      self.dataset.GetRasterBand(i+1).SetNoDataValue(noData)
+
+  ################################################################
+  # write rows of a band (counted from 0) starting at row yOff
+  def write(self, band, values, yOff=0):
+    myValues=where(isnan(values), self.noData, values)
+    self.dataset.GetRasterBand(band+1).WriteArray(myValues, 0, yOff)
+
+  ################################################################
+  # finish writing the file
+  def close(self):
+    self.dataset.FlushCache()
+    self.dataset=None
+
+################################################################
+## class to write an ESRI ascii grid (AAIGrid) a block of rows at a time
+## the rows are given top first as 2-D arrays of ncols columns, each
+## block is formatted in one go and written through a large buffer
+## fmt is the format of each value, by default %d for integer arrays
+## and enough digits to read floats back exactly
+## NaN values are written as noData, which is given in the header
+class asciiGridWriter:
+
+  BufferSize=1048576
+
+  def __init__(self, fileName, ncols, nrows, xMin, yMin, cellSize, fmt=None, noData=None):
+    self.ncols=ncols
+    self.fmt=fmt
+    self.noData=noData
+    self.file=open(fileName, "w", self.BufferSize)
+
+    myHeader="""ncols           %s
+nrows           %s
+xllcorner       %s
+yllcorner       %s
+cellsize        %s
+""" %(ncols, nrows, xMin, yMin, cellSize)
+    if noData is not None:
+      myHeader+="NODATA_value    %s\n" %noData
+    self.file.write(myHeader)
+
+  ################################################################
+  def write(self, rows):
+    rows=asarray(rows)
+    if len(rows)==0:
+      return
+    myFormat=self.fmt
+    if myFormat is None:
+      if issubclass(rows.dtype.type, integer):
+        myFormat="%d"
+      else:
+        myFormat="%.17g"
+    if self.noData is not None and not issubclass(rows.dtype.type, integer):
+      rows=where(isnan(rows), self.noData, rows)
+    # one format operation for the whole block
+    myRow=" ".join([myFormat]*self.ncols)+"\n"
+    self.file.write((myRow*len(rows)) %tuple(rows.ravel().tolist()))
+
+  ################################################################
+  def close(self):
+    self.file.close()
+
+################################################################
+# read an ascii grid file a block of rows at a time
+# yields the header first, a dict of ncols, nrows, xllcorner,
+# yllcorner, cellsize and NODATA_value (None if not given), then
+# [values, mask, yStart, yStop] for each block of rows, top first, as
+# rasterBandReader.strips() (mask is False for NODATA_value)
+# maxCells is the most values held for each block
+# raises ValueError if the file is not a complete ascii grid
+def asciiGridStrips(fileName, maxCells=4194304, bufferSize=1048576):
+
+  myFile=open(fileName, "r", bufferSize)
+  try:
+    # the header lines are a keyword and a value
+    myKeys=["ncols", "nrows", "xllcorner", "yllcorner", "xllcenter", "yllcenter",
+            "cellsize", "nodata_value"]
+    myHeader={}
+    myText=""
+    while True:
+      myLine=myFile.readline()
+      myWords=myLine.split()
+      if len(myWords)!=2 or myWords[0].lower() not in myKeys:
+        myText=myLine
+        break
+      myHeader[myWords[0].lower()]=myWords[1]
+    for myKey in ["ncols", "nrows", "cellsize"]:
+      if myKey not in myHeader:
+        raise ValueError("%s is missing %s, not an ascii grid" %(fileName, myKey))
+    [myCols, myRows]=[int(myHeader["ncols"]), int(myHeader["nrows"])]
+    myCellSize=float(myHeader["cellsize"])
+    myNoData=myHeader.get("nodata_value")
+    if myNoData is not None:
+      myNoData=float(myNoData)
+    # corners are given either as the corner or as the centre of the cell
+    [xMin, yMin]=[None, None]
+    if "xllcorner" in myHeader:
+      [xMin, yMin]=[float(myHeader["xllcorner"]), float(myHeader["yllcorner"])]
+    elif "xllcenter" in myHeader:
+      [xMin, yMin]=[float(myHeader["xllcenter"])-myCellSize/2, float(myHeader["yllcenter"])-myCellSize/2]
+    yield {"ncols": myCols, "nrows": myRows, "xllcorner": xMin, "yllcorner": yMin,
+           "cellsize": myCellSize, "NODATA_value": myNoData}
+
+    myBlock=max(1, maxCells//max(myCols, 1))
+    # values parsed but not yet given out
+    [myParsed, myCount]=[[], 0]
+    yStart=0
+    while yStart<myRows:
+      myWant=min(myBlock, myRows-yStart)*myCols
+      # parse whole buffers, keeping back a number cut at the end
+      while myCount<myWant:
+        myRead=myFile.read(bufferSize)
+        myText+=myRead
+        if myRead:
+          myCut=max([myText.rfind(c) for c in " \t\r\n"])+1
+        else:
+          myCut=len(myText)
+        if myText[:myCut].strip():
+          myParsed.append(fromstring(myText[:myCut], sep=" "))
+          myCount+=len(myParsed[-1])
+        myText=myText[myCut:]
+        if not myRead and myCount<myWant:
+          raise ValueError("%s ends before the last row" %fileName)
+      myValues=concatenate(myParsed)
+      [myParsed, myCount]=[[myValues[myWant:]], len(myValues)-myWant]
+      yStop=yStart+myWant//myCols
+      myStrip=myValues[:myWant].reshape(yStop-yStart, myCols)
+      myMask=logical_not(isnan(myStrip))
+      if myNoData is not None:
+        myMask&=(myStrip!=myNoData)
+      yield [myStrip, myMask, yStart, yStop]
+      yStart=yStop
+  finally:
+    myFile.close()
+
+################################################################
+# read a whole ascii grid file
+# returns [values, mask, header] as asciiGridStrips, values has a row
+# for each row of the file, top first
+def readAsciiGrid(fileName, maxCells=4194304):
+  myStrips=asciiGridStrips(fileName, maxCells)
+  myHeader=myStrips.next()
+  myValues=empty((myHeader["nrows"], myHeader["ncols"]))
+  myMask=zeros((myHeader["nrows"], myHeader["ncols"]), dtype=bool)
+  for [myStrip, myStripMask, yStart, yStop] in myStrips:
+    myValues[yStart:yStop]=myStrip
+    myMask[yStart:yStop]=myStripMask
+  return [myValues, myMask, myHeader]
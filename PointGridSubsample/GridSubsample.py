@@ -0,0 +1,262 @@
+"""
+/***************************************************************************
+GridSubsample
+Part of the PointGridSubsample QGIS plugin
+Subsample a set of points so that up to N input points are selected per
+cell of a grid.  Free of any Qt/QGIS code so that it can be run from the
+dialog or the command line.
+                             -------------------
+begin                : 2011-01-10
+copyright            : (C) 2011 by Chris Yesson
+email                : chris [dot] yesson [at] ioz [dot] ac [dot] uk
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from numpy import asarray, floor, int64, argsort, concatenate, sort, arange, where
+from numpy import maximum, zeros, lexsort, empty, save, load, searchsorted, minimum
+from numpy import ones, insert, delete, unique, repeat, cumsum
+from numpy import random as nprandom
+from heapq import merge
+from tempfile import mkdtemp
+import os
+
+################################################################
+# integer [col, row] of the cell holding each point, counted from the
+# lower left corner xMin,yMin of the grid
+def cellKeys(x, y, xMin, yMin, xSize, ySize):
+  myCols=floor((asarray(x, dtype=float)-xMin)/xSize).astype(int64)
+  myRows=floor((asarray(y, dtype=float)-yMin)/ySize).astype(int64)
+  return [myCols, myRows]
+
+################################################################
+# one number for each cell, the same whichever points are given so
+# that keys from different chunks of points can be compared
+def cellNumbers(x, y, xMin, yMin, xSize, ySize):
+  [myCols, myRows]=cellKeys(x, y, xMin, yMin, xSize, ySize)
+  return myCols*2**32+(myRows+2**31)
+
+################################################################
+# the points to keep from arrays of cell numbers and random priorities:
+# the perCell points of each cell with the lowest priorities
+# Points are sorted by priority, then a stable sort by cell keeps that
+# order within each cell, so the time taken grows as n log n
+# returns [indices, ranks] of the kept points sorted by cell then
+# priority, where rank counts from 0 within each cell
+def lowestPerCell(myCells, myPriority, perCell):
+  myOrder=argsort(myPriority)
+  myOrder=myOrder[argsort(myCells[myOrder], kind="mergesort")]
+  myCells=myCells[myOrder]
+  # rank of each point within its cell
+  myFirst=concatenate([[True], myCells[1:]!=myCells[:-1]])
+  myIndex=arange(len(myCells))
+  myRank=myIndex-maximum.accumulate(where(myFirst, myIndex, 0))
+  return [myOrder[myRank<perCell], myRank[myRank<perCell]]
+
+################################################################
+# reservoir of up to perCell points for each cell of a grid of xSize by
+# ySize cells with its lower left corner at xMin,yMin
+# Points are given a chunk at a time with add(), each gets a random
+# priority and the lowest perCell priorities of each cell are kept, so
+# only the kept points and one chunk are ever held.  The priorities are
+# drawn in turn from random, so the points chosen do not depend on the
+# size of the chunks.
+# The kept points are held sorted by cell then priority.  Each chunk is
+# cut down to its own lowest perCell priorities per cell, then found in
+# the kept points with searchsorted: only those ranking below perCell
+# in their cell go in, pushing out the highest of that cell, so a chunk
+# costs its own sort and one pass to insert, whatever has been kept.
+# random is a numpy RandomState, or the numpy.random module by default
+class gridReservoir:
+
+  ################################################################
+  def __init__(self, xMin, yMin, xSize, ySize, perCell=1, random=None):
+    if random is None:
+      random=nprandom
+    self.grid=[xMin, yMin, xSize, ySize]
+    self.perCell=perCell
+    self.random=random
+    # number of points seen so far
+    self.count=0
+    self.cells=zeros(0, dtype=int64)
+    self.priority=zeros(0)
+    self.ids=zeros(0, dtype=int64)
+
+  ################################################################
+  # add a chunk of points, x and y are sequences of their coordinates
+  # ids identifies each point, by default they are counted from 0 in
+  # the order the points are added
+  # returns an array of the ids no longer kept: those of the chunk that
+  # didn't get in and those pushed out by them
+  def add(self, x, y, ids=None):
+    myCells=cellNumbers(x, y, *self.grid)
+    if ids is None:
+      ids=arange(self.count, self.count+len(myCells))
+    ids=asarray(ids, dtype=int64)
+    self.count+=len(myCells)
+    if len(myCells)==0:
+      return zeros(0, dtype=int64)
+    myPriority=self.random.rand(len(ids))
+    [myNew, myRank]=lowestPerCell(myCells, myPriority, self.perCell)
+
+    # where each new point falls among the kept points of its cell
+    myLeft=searchsorted(self.cells, myCells[myNew], "left")
+    myRight=searchsorted(self.cells, myCells[myNew], "right")
+    myBelow=zeros(len(myNew), dtype=int64)
+    if len(self.cells):
+      for k in range(self.perCell):
+        myIndex=minimum(myLeft+k, len(self.cells)-1)
+        myBelow+=(myLeft+k<myRight) & (self.priority[myIndex]<myPriority[myNew])
+    # rank among both the kept points and the new ones of the cell
+    myIn=(myBelow+myRank)<self.perCell
+    [myNew, myLeft, myRight, myBelow]=[myNew[myIn], myLeft[myIn], myRight[myIn], myBelow[myIn]]
+
+    # the kept points with the highest priorities of a cell make way for
+    # the new ones, they are the last of its (sorted) run of kept points
+    [myFirst, myCounts]=unique(myCells[myNew], return_index=True, return_counts=True)[1:]
+    [myStarts, myEnds]=[myLeft[myFirst], myRight[myFirst]]
+    myExcess=maximum(myEnds-myStarts+myCounts-self.perCell, 0)
+    myOut=repeat(myEnds-myExcess, myExcess)+arange(myExcess.sum())-repeat(cumsum(myExcess)-myExcess, myExcess)
+
+    myDropped=ones(len(ids), dtype=bool)
+    myDropped[myNew]=False
+    myDropped=concatenate([ids[myDropped], self.ids[myOut]])
+
+    # insert the new points before their place counting those removed
+    myAt=myLeft+myBelow
+    myAt-=searchsorted(myOut, myAt, "left")
+    self.cells=insert(delete(self.cells, myOut), myAt, myCells[myNew])
+    self.priority=insert(delete(self.priority, myOut), myAt, myPriority[myNew])
+    self.ids=insert(delete(self.ids, myOut), myAt, ids[myNew])
+    return myDropped
+
+  ################################################################
+  # sorted array of the ids of the points kept so far
+  def selected(self):
+    return sort(self.ids)
+
+################################################################
+# the same choice of points as gridReservoir, for more points than fit
+# in memory
+# Each chunk of [cell, priority, id] records is cut down to its own
+# perCell lowest priorities per cell, and once RunSize records are held
+# they are sorted and saved as a run in a temporary .npy file.
+# selected() merges the runs in cell then priority order and keeps the
+# first perCell records of each cell, so only one block of each run is
+# read at a time.  close() removes the temporary files.
+# directory is where the runs are saved, by default the system temp
+class gridRuns:
+
+  # records held before they are saved as a run
+  RunSize=1000000
+  # records read from each run at a time while merging
+  BlockSize=10000
+
+  ################################################################
+  def __init__(self, xMin, yMin, xSize, ySize, perCell=1, random=None, directory=None):
+    if random is None:
+      random=nprandom
+    self.grid=[xMin, yMin, xSize, ySize]
+    self.perCell=perCell
+    self.random=random
+    self.count=0
+    self.directory=mkdtemp(prefix="gridsubsample", dir=directory)
+    self.runs=[]
+    self.held=[]
+
+  ################################################################
+  # add a chunk of points, as for gridReservoir.add
+  def add(self, x, y, ids=None):
+    myCells=cellNumbers(x, y, *self.grid)
+    if ids is None:
+      ids=arange(self.count, self.count+len(myCells))
+    self.count+=len(myCells)
+    if len(myCells)==0:
+      return
+    myPriority=self.random.rand(len(ids))
+    myKeep=lowestPerCell(myCells, myPriority, self.perCell)[0]
+    myRecords=empty(len(myKeep), dtype=[("cell", int64), ("priority", float), ("id", int64)])
+    myRecords["cell"]=myCells[myKeep]
+    myRecords["priority"]=myPriority[myKeep]
+    myRecords["id"]=asarray(ids, dtype=int64)[myKeep]
+    self.held.append(myRecords)
+    if sum([len(myHeld) for myHeld in self.held])>=self.RunSize:
+      self.spill()
+
+  ################################################################
+  # save the records held as a sorted run
+  def spill(self):
+    if len(self.held)==0:
+      return
+    myRecords=concatenate(self.held)
+    myRecords=myRecords[lexsort([myRecords["priority"], myRecords["cell"]])]
+    myFile=os.path.join(self.directory, "run%i.npy" %len(self.runs))
+    save(myFile, myRecords)
+    self.runs.append(myFile)
+    self.held=[]
+
+  ################################################################
+  # the records of a saved run in order, as (cell, priority, id) tuples
+  def readRun(self, myFile):
+    myRecords=load(myFile, mmap_mode="r")
+    for myStart in range(0, len(myRecords), self.BlockSize):
+      myBlock=myRecords[myStart:myStart+self.BlockSize]
+      for myRecord in zip(myBlock["cell"].tolist(), myBlock["priority"].tolist(),
+                          myBlock["id"].tolist()):
+        yield myRecord
+
+  ################################################################
+  # sorted array of the ids of the chosen points
+  def selected(self):
+    self.spill()
+    myIds=[]
+    myLastCell=None
+    for (myCell, myPriority, myId) in merge(*[self.readRun(myFile) for myFile in self.runs]):
+      if myCell!=myLastCell:
+        [myLastCell, myRank]=[myCell, 0]
+      if myRank<self.perCell:
+        myIds.append(myId)
+      myRank+=1
+    return sort(asarray(myIds, dtype=int64))
+
+  ################################################################
+  def close(self):
+    for myFile in self.runs:
+      os.remove(myFile)
+    os.rmdir(self.directory)
+    self.runs=[]
+
+################################################################
+# which of ids are in the sorted array selected, as a boolean array
+def isSelected(ids, selected):
+  ids=asarray(ids, dtype=int64)
+  if len(selected)==0:
+    return zeros(len(ids), dtype=bool)
+  myIndex=minimum(searchsorted(selected, ids), len(selected)-1)
+  return selected[myIndex]==ids
+
+################################################################
+# pick perCell points at random from each cell of a grid of xSize by
+# ySize cells with its lower left corner at xMin,yMin, x and y are
+# sequences (or arrays) of the point coordinates, all the points of
+# a cell are kept if it has perCell or fewer
+# random is a numpy RandomState, or the numpy.random module by default
+# progress(done, total) is called when done, if given
+# returns an array of the indices of the chosen points, in input order
+def gridSubsample(x, y, xMin, yMin, xSize, ySize, random=None, progress=None, perCell=1):
+
+  myReservoir=gridReservoir(xMin, yMin, xSize, ySize, perCell, random)
+  myReservoir.add(x, y)
+
+  if progress:
+    progress(myReservoir.count, myReservoir.count)
+
+  return myReservoir.selected()
@@ -25,10 +25,10 @@ from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 from qgis.core import *
 from Ui_PointGridSubsample import Ui_PointGridSubsample
-from numpy.random import randint
 from ecogis.UI_Tools import *
-from math import floor
+from GridSubsample import *
 from os.path import basename, splitext
+from numpy.random import RandomState
 
 class PointGridSubsample(QDialog, Ui_PointGridSubsample):
 
@@ -36,6 +36,14 @@ class PointGridSubsample(QDialog, Ui_PointGridSubsample):
   #debug=open("PointGridSubsample.log","w")
   debug=None
 
+  # the analysis thread while it runs
+  worker=None
+
+  # number of points read before they are sampled
+  ChunkSize=10000
+  # layers with more points than this are sampled on disk
+  MemoryPoints=5000000
+
   ################################################################
   def __init__(self, iface):
     QDialog.__init__(self)
@@ -62,12 +70,23 @@ class PointGridSubsample(QDialog, Ui_PointGridSubsample):
   ################################################################
   # Called when "OK" button pressed (based on the Carson Farmer's PointsInPoly Plugin, 2008)
   def accept(self): 
+    # nothing to do while an analysis is running
+    if self.worker is not None and self.worker.isRunning():
+      return
     doit=False
     if self.rasterLayerSelect.checkSelected and \
           self.pointLayerSelect.checkSelected and \
           self.shapeOutput.checkOutFile():
       self.runAnalysis()
 
+  ################################################################
+  # Cancel stops a running analysis, otherwise closes the dialog
+  def reject(self):
+    if self.worker is not None and self.worker.isRunning():
+      self.worker.cancel()
+    else:
+      QDialog.reject(self)
+
   ################################################################
   # Show information when the info button is pressed
   # based on about box of csw client by Alexander Bruy & Maxim Dubinin
@@ -81,11 +100,12 @@ class PointGridSubsample(QDialog, Ui_PointGridSubsample):
     lines.addWidget( title )
 
     myText="""
-Subsample a set of points so that N (at the moment 1) input points are
-selected per cell in the template raster file.  This is a common & useful
-exercise for niche modelling, or anywhere that sample data are to be 
-treated as presence data rather than abundance data.  This is akin to the
-'spatially unique' filter applied in openModeller.
+Subsample a set of points so that N input points are selected at random
+per cell in the template raster file (all the points of a cell with N or
+fewer).  This is a common & useful exercise for niche modelling, or anywhere
+that sample data are to be treated as presence data rather than abundance
+data.  With N=1 this is akin to the 'spatially unique' filter applied in
+openModeller.  The same random seed gives the same selection.
 """
     lines.addWidget( QLabel( myText ) )
 
@@ -127,66 +147,115 @@ treated as presence data rather than abundance data.  This is akin to the
     # get the point layer
     self.pointLayerSelected=self.pointLayerSelect.getSelected()
     pt=self.pointLayerSelected[0]
-    # and a copy 
-    pt2=self.pointLayerSelected[0]
+
+    # the subsampling is run in a worker thread, which opens the point
+    # layer again for itself as providers can't be shared between threads
+    self.worker=analysisWorker(self, self.statusLabel, self.subsample,
+                               unicode(pt.source()), unicode(pt.providerType()), pt.srs(),
+                               str(self.outShape.displayText()), xMin, yMin, xSize, ySize,
+                               self.pointsPerCell.value(), self.seedBox.value())
+    QObject.connect(self.worker, SIGNAL("analysisFinished(PyQt_PyObject)"), self.analysisFinished)
+    self.worker.start()
+
+  ################################################################
+  # run in the worker thread, so only uses its arguments
+  def subsample(self, mySource, myProviderKey, mySrs, myOutName, xMin, yMin, xSize, ySize,
+                myPerCell, mySeed, progress=None):
 
     # load the given sample points into a list
+    pt = QgsVectorLayer(mySource, "subsample input", myProviderKey)
     provider = pt.dataProvider()
     feat = QgsFeature()
     allAttrs = provider.attributeIndexes()
-    # start data retreival: fetch geometry for each feature
-    provider.select([0])
+    # start data retreival: fetch geometry and attributes for each feature
+    provider.select(allAttrs)
 
-    # generate output file based on input srs and write as we loop
-    myOutShape=QgsVectorFileWriter(self.outShape.displayText(), 
+    # generate output file based on input srs
+    myOutShape=QgsVectorFileWriter(myOutName, 
                                    "CP1250", provider.fields(),
-                                   QGis.WKBPoint, pt.srs())
-
-    # list to store unique points 
-    myPoints=[]
-    # parallel list for counting point incidence
-    myPointsCt=[]
-
-    # this method is sub-optimal for large files (10k+ points)
-    # could loop through every pixel (bad for large grids + few points)
-    # or every pixel within the extent of points
-
-    # create a list of x,y cell corners
+                                   QGis.WKBPoint, mySrs)
+
+    myTotal=provider.featureCount()
+    if myTotal>self.MemoryPoints:
+      self.subsampleOnDisk(provider, myOutShape, xMin, yMin, xSize, ySize, myPerCell, mySeed,
+                           progress)
+      myOutShape=None
+      return
+
+    # read the points once, a chunk at a time, keeping only the
+    # features still in the reservoir, see GridSubsample.py
+    progress(0, 1, "Sampling")
+    myReservoir=gridReservoir(xMin, yMin, xSize, ySize, myPerCell, RandomState(mySeed))
+    myFeatures={}
+    myX=[]
+    myY=[]
     while provider.nextFeature(feat):
-      geom=feat.geometry()
-      gpoint=geom.asPoint()
-
-      # round xy to the nearest upper left corner
-      myPoint=[floor(gpoint.x()/xSize)*xSize, 
-               floor(gpoint.y()/ySize)*ySize]
-      
-      # check list of points -add if required
-      if not myPoints.count(myPoint):
-        myPoints.append(myPoint)
-        myPointsCt.append(1)
-      else:
-        # have it already so add to count
-        myPointsCt[myPoints.index(myPoint)]+=1
-
-    # loop through unique x,y
-    for i,myPoint in enumerate(myPoints):
-      cellExtent=QgsRectangle(myPoint[0], myPoint[1], 
-                              myPoint[0]+xSize, myPoint[1]+ySize)
-
-      # set spatial filter to extent
-      provider.select(allAttrs, cellExtent)
-
-      # skip through a random number of matching points
-      # (i.e. select one at random)
-      for i in range(randint(1,myPointsCt[i]+1)):
-        provider.nextFeature(feat)
-      
-      # store this feature
-      myOutShape.addFeature(feat)
+      gpoint=feat.geometry().asPoint()
+      myFeatures[myReservoir.count+len(myX)]=QgsFeature(feat)
+      myX.append(gpoint.x())
+      myY.append(gpoint.y())
+      if len(myX)==self.ChunkSize:
+        self.addChunk(myReservoir, myX, myY, myFeatures)
+        [myX, myY]=[[], []]
+        progress(myReservoir.count, myTotal, "Sampling")
+    self.addChunk(myReservoir, myX, myY, myFeatures)
+
+    # store the chosen features in input order
+    progress(0, 1, "Writing")
+    for i in myReservoir.selected():
+      myOutShape.addFeature(myFeatures[i])
 
     # write to file
     myOutShape=None
 
+  ################################################################
+  # sample a chunk of points, dropping the features no longer chosen
+  def addChunk(self, myReservoir, myX, myY, myFeatures):
+    for i in myReservoir.add(myX, myY).tolist():
+      del myFeatures[i]
+
+  ################################################################
+  # the same choice of points for layers too big to hold in memory
+  # The first pass reads only the geometry and saves runs of
+  # [cell, priority, feature id] to temporary files, which are merged to
+  # find the chosen ids.  Only the chosen features are then fetched, by
+  # id in sorted order, with their attributes and written out.
+  def subsampleOnDisk(self, provider, myOutShape, xMin, yMin, xSize, ySize, myPerCell, mySeed,
+                      progress):
+
+    feat = QgsFeature()
+    myTotal=provider.featureCount()
+    myRuns=gridRuns(xMin, yMin, xSize, ySize, myPerCell, RandomState(mySeed))
+    try:
+      progress(0, 1, "Sampling")
+      provider.select([])
+      [myX, myY, myIds]=[[], [], []]
+      while provider.nextFeature(feat):
+        gpoint=feat.geometry().asPoint()
+        myX.append(gpoint.x())
+        myY.append(gpoint.y())
+        myIds.append(feat.id())
+        if len(myX)==self.ChunkSize:
+          myRuns.add(myX, myY, myIds)
+          [myX, myY, myIds]=[[], [], []]
+          progress(myRuns.count, myTotal, "Sampling")
+      myRuns.add(myX, myY, myIds)
+
+      progress(0, 1, "Merging")
+      mySelected=myRuns.selected()
+    finally:
+      myRuns.close()
+
+    myAttrs=provider.attributeIndexes()
+    for i, myId in enumerate(mySelected.tolist()):
+      if provider.featureAtId(myId, feat, True, myAttrs):
+        myOutShape.addFeature(feat)
+      progress(i+1, len(mySelected), "Writing")
+
+  ################################################################
+  # when the points have been written
+  def analysisFinished(self, myResult):
+
     # add layer to toc 
     if self.addToToc.checkState() == Qt.Checked:
       myName=basename(str(self.outShape.displayText()))
@@ -194,5 +263,3 @@ treated as presence data rather than abundance data.  This is akin to the
                                 myName, "ogr")
       QgsMapLayerRegistry.instance().addMapLayer(myVlayer)
     self.statusLabel.setText("Finished")
-    self.repaint()
-
@@ -24,9 +24,8 @@ from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 from qgis.core import *
 from Ui_PseudoDist import Ui_PseudoDist
-from numpy.random import rand
-from math import sqrt, pow, log, exp
 from ecogis.UI_Tools import *
+from PseudoPoints import *
 
 class PseudoDist(QDialog, Ui_PseudoDist):
 
@@ -34,10 +33,13 @@ class PseudoDist(QDialog, Ui_PseudoDist):
   #debug=open("PseudoDist.log", "w")
   debug=None
 
-  # set up some important global variables
-  # origin point and value
-  Origin=None
-  OriginVal=None
+  # the analysis thread while it runs
+  worker=None
+
+  # number of processes for the replicates
+  # 1 makes them in the QGIS process, see RasterAutoCorrelation.Workers
+  Workers=1
+
   # model parameters
   Curve=None
   Method=None
@@ -67,6 +69,9 @@ class PseudoDist(QDialog, Ui_PseudoDist):
   ################################################################
   # Called when "OK" button pressed (based on the Carson Farmer's PointsInPoly Plugin, 2008)
   def accept(self): 
+    # nothing to do while an analysis is running
+    if self.worker is not None and self.worker.isRunning():
+      return
     if self.rasterLayerSelect.checkSelected() and \
           self.shapeOutput.checkOutFile():
       # all tests passed! Let's go on
@@ -74,6 +79,14 @@ class PseudoDist(QDialog, Ui_PseudoDist):
       self.repaint()
       self.runAnalysis()
 
+  ################################################################
+  # Cancel stops a running analysis, otherwise closes the dialog
+  def reject(self):
+    if self.worker is not None and self.worker.isRunning():
+      self.worker.cancel()
+    else:
+      QDialog.reject(self)
+
   ################################################################
   # Show information when the info button is pressed
   # based on about box of csw client by Alexander Bruy & Maxim Dubinin
@@ -85,7 +98,7 @@ class PseudoDist(QDialog, Ui_PseudoDist):
     title = QLabel( QApplication.translate( dlgTitle, "<b>PseudoDist - Generate distribution data following a model </b>" ) )
     title.setAlignment( Qt.AlignHCenter | Qt.AlignVCenter )
     lines.addWidget( title )
-    lines.addWidget( QLabel( QApplication.translate( dlgTitle, "Given a background raster grid, generate a set of 'pseudo-distribution' points \nfollowing a model.  Starts by generating a random 'point of origin'.  Subsequent \npoints are selected either randomly or following a distance based model. Distance \nmodels can be based on geographic or environmental distance. One of three curve \nshapes can be applied to distance models, to define how the probability of selection \n deteriorates with distance.\n i) Gaussian model assumes a 'normal'-shaped curve \n ii) Linear curves assume linear degredation with distance up to the 'range'limit. \n iii) Threshhold assumes probability p=1 within the threshold distance, p=0 otherwise.\n  Using this tool it is possible to generate data following the CSR and SIM methods of \nBahn and McGill (2007) and the threshold response model of Meynard and Quinn (2007).")))
+    lines.addWidget( QLabel( QApplication.translate( dlgTitle, "Given a background raster grid, generate a set of 'pseudo-distribution' points \nfollowing a model.  Starts by generating a random 'point of origin'.  Subsequent \npoints are selected either randomly or following a distance based model. Distance \nmodels can be based on geographic or environmental distance. One of three curve \nshapes can be applied to distance models, to define how the probability of selection \n deteriorates with distance.\n i) Gaussian model assumes a 'normal'-shaped curve \n ii) Linear curves assume linear degredation with distance up to the 'range'limit. \n iii) Threshhold assumes probability p=1 within the threshold distance, p=0 otherwise.\n  Using this tool it is possible to generate data following the CSR and SIM methods of \nBahn and McGill (2007) and the threshold response model of Meynard and Quinn (2007).\n  Points are normally chosen by trial and error, giving up if a point can't be found \nin 1000 tries.  With 'Sample probability surface' they are drawn straight from the \nprobability of every cell around the point of origin, which takes the same time \nhowever small the range.  Environmental points are always drawn this way, from the \ncells grouped by value.\n  The same random seed always gives the same points (from the command line the \nreplicates can also be made in parallel, with the same result).")))
 
     lines.addWidget( QLabel( QApplication.translate( dlgTitle, "<b>Output:</b>" ) ) )
     lines.addWidget( QLabel( QApplication.translate( dlgTitle, "A shape file containing the generated points.  The attribute table contains these fields: ")))
@@ -111,83 +124,7 @@ class PseudoDist(QDialog, Ui_PseudoDist):
 
   ################################################################
   # analysis bit starts here
-
-  ################################################################
-  # implement the probability of selection model
-  def probCurve(self, Dist):
-
-    if self.Method=="Distance":
-      # range is given in km, but we want meters
-      Limit=self.outRange.value()*1000
-    else:
-      Limit=self.outRange.value()
-
-    if self.Curve=='Gaussian':
-        # a standard gaussian equation is of the form
-        # p = y = a exp( -(x-b)^2 / 2(c^2) )
-        # a = y axis stretch (don't need unless we want p<1 when x=mean)
-        #     a = 1 gives p=1 when x=0
-        # b = offset from zero (mean) so (x-b) = distance from mean
-        # c = x axis stretch (proportional to limit)
-
-        # rescale equation so that p=0.05 when distance=limit
-        LimitRescaled=Limit/sqrt(abs(log(0.05))*2)
-        p=exp(-1*(pow(Dist, 2) / \
-                      (2*pow(LimitRescaled,2))))
-
-    elif self.Curve=='Linear':
-        # p=1 when cellvalue=OriginValue
-        # p=0 when cellvalue=OriginValue+-Limit
-        # p<0 when cellvalue more than 1 limit from Origin
-        p= (-1*abs(Dist)+Limit)/Limit
-
-    elif self.Curve=="Threshhold":
-        # check environmental distance from point of origin
-        # select point if it is within one limit
-        p=int(Dist<Limit)
-
-    if self.debug:
-      self.debug.write("method=%s, curve=%s, distance=%s, p=%s\n" %(self.Method, self.Curve, Dist, p))
-      self.debug.flush()
-
-    return p
-
-
-  ################################################################
-  # decide if this point is to be selected
-  def choosePoint(self, Point, CellValue, method):
-
-    # check if point is within the mask
-    if CellValue=="null (no data)" or CellValue=="out of extent":
-      prob =0
-
-    # check if we meed the other conditions
-    else:
-
-      # define the probability of selection default=1
-      prob=1
-
-      # check distance from origin
-      if method=="Distance":
-        d = QgsDistanceArea()
-        d.setProjectionsEnabled(True)
-        dist=d.measureLine(Point, self.Origin)
-        prob=self.probCurve(dist)
-        # get probability based on distance and method
-        if self.debug:
-          self.debug.write("point %s, origin %s, dist %s, p=%s\n" %(Point, self.Origin, dist, prob))
-          self.debug.flush()
-
-      elif method=="Responsive":
-        # check environmental distance from point of origin
-        dist=abs(float(CellValue)-self.OriginVal)
-        prob=self.probCurve(dist)
-
-
-    # Pick a random number between [0,1), select the point if the
-    #  random number is lower than the probability.
-    # This will select the point with p=0.5 with a frequency of ~0.5
-    return prob
+  # the sampling itself is in PseudoPoints.py
 
   ################################################################
   def runAnalysis(self):
@@ -220,8 +157,14 @@ class PseudoDist(QDialog, Ui_PseudoDist):
     # fetch first (only) raster layer
     myInf = self.rasterLayerSelected[0][0]
     myInfBand = self.rasterLayerSelected[0][1]
-    myNoData = myInf.noDataValue()[0]
-    myExtent = myInf.extent()
+    myReader = rasterBandReader(myInf, myInfBand)
+
+    # distances on the ellipsoid where the layer is not projected,
+    # otherwise straight lines in map units (metres)
+    if myInf.srs().geographicFlag():
+      myDistance=ellipsoidDistance
+    else:
+      myDistance=planarDistance
 
     # set up output fields
     myOutFields={0: QgsField("Replicate", QVariant.Int),
@@ -231,95 +174,67 @@ class PseudoDist(QDialog, Ui_PseudoDist):
                  4: QgsField("Value", QVariant.Double),
                  5: QgsField("p", QVariant.Double)}
 
+    # sample in a worker thread, writing as we go
+    # the output file is made by the worker, as a writer can't be shared
+    # between threads
+    self.worker=analysisWorker(self, self.statusLabel, self.writePoints,
+                               unicode(self.outShape.displayText()), myOutFields, myInf.srs(),
+                               myReader,
+                               self.outPoints.value(), self.outReps.value(),
+                               self.Method, self.Curve, self.outRange.value(), myDistance,
+                               self.surfaceCheck.isChecked(), self.seedBox.value(), self.Workers)
+    QObject.connect(self.worker, SIGNAL("analysisFinished(PyQt_PyObject)"), self.analysisFinished)
+    self.worker.start()
+
+  ################################################################
+  # run in the worker thread, so only uses its arguments
+  # write each replicate of points to the output file
+  # pseudoDist raises RuntimeError if it gets stuck
+  def writePoints(self, myOutName, myOutFields, mySrs, myReader, myPoints, myReps,
+                  myMethod, myCurve, myRange, myDistance, mySurface, mySeed, myWorkers,
+                  progress=None):
+
     # generate output file based on input srs and write as we loop
-    myOutShape=QgsVectorFileWriter(self.outShape.displayText(), 
+    myOutShape=QgsVectorFileWriter(myOutName,
                                    "CP1250", myOutFields,
-                                   QGis.WKBPoint, myInf.srs())
+                                   QGis.WKBPoint, mySrs)
     if myOutShape.hasError()!= QgsVectorFileWriter.NoError:
       print "Error when creating shapefile: ", myOutShape.hasError()
 
-    # loop through replicates
-    for rep in range(self.outReps.value()):
-
-      # set up lists for random points
-      myPoints=[] # format [qgspoint, value, probability of selection]
-
-      # get random starting point 
-      keepMe=False
-      while not keepMe:
-        myOrigin=QgsPoint(myExtent.xMinimum()+ (rand()*(myExtent.xMaximum()-myExtent.xMinimum())), myExtent.yMinimum()+ (rand()*(myExtent.yMaximum()-myExtent.yMinimum())))
-        myOriginval=myInf.identify(myOrigin)[1].values()[myInfBand]
-        # any random point within the extent will do, so over-ride the selected method
-        p=self.choosePoint(myOrigin, myOriginval, "random")
-        keepMe=rand()<p
-
-      # store for global use
-      self.Origin=myOrigin
-      self.OriginVal=float(myOriginval)
-      if self.debug:
-        self.debug.write("generated origin %s, value=%s, p=%s\n" %(self.Origin, myOriginval, p))
-        self.debug.flush()
-
-      myPoints.append([self.Origin, myOriginval, p])
-
-      # remember if something goes wrong
-      bailOut=False
-
-      # loop through to get points
-      for j in range(1,self.outPoints.value()):
-
-        keepMe=False
-        loopCheck=0
-
-        # keep going until we find a vaild point
-        while (not keepMe) and (not bailOut):
-          # pick a random point
-          myPoint=QgsPoint(myExtent.xMinimum()+ (rand()*(myExtent.xMaximum()-myExtent.xMinimum())), myExtent.yMinimum()+ (rand()*(myExtent.yMaximum()-myExtent.yMinimum())))
-
-          myPointVal=myInf.identify(myPoint)[1].values()[myInfBand]
-
-          myPointP=self.choosePoint(myPoint, myPointVal, self.Method)
-          if rand()<myPointP:
-            keepMe=True
-
-          # bail out if we get stuck
-          loopCheck+=1
-          if loopCheck>1000:
-            QMessageBox.information(self, "PseudoDist", "Failed to find sufficient points that meet your input parameters, try increasing your distance parameter.")
-            bailOut=True
-            keepMe=True
-            break
-            myPointP=-1
-
-        if not bailOut:
-          myPoints.append([myPoint,myPointVal, myPointP])
-
-      if not bailOut:
-        # write the points to the output file
-        for i in range(0,len(myPoints)):
-          myFt=QgsFeature()
-          myFt.setGeometry(QgsGeometry.fromPoint(myPoints[i][0]))
-          myFt.addAttribute(0, QVariant(rep))
-          myFt.addAttribute(1, QVariant(i))
-          myFt.addAttribute(2, QVariant(myPoints[i][0].x()))
-          myFt.addAttribute(3, QVariant(myPoints[i][0].y()))
-          myFt.addAttribute(4, QVariant(myPoints[i][1]))
-          myFt.addAttribute(5, QVariant(myPoints[i][2]))
-          myOutShape.addFeature(myFt)
-
-    if not bailOut:
-      # flush written file
-      del myOutShape
-
-      # load into qgis if asked
-      if self.addToToc.checkState() == Qt.Checked:
-        myVlayer = QgsVectorLayer(self.outShape.displayText(), 
-                                  "PseudoDist Output", "ogr")
-        QgsMapLayerRegistry.instance().addMapLayer(myVlayer)
-
-      self.statusLabel.setText("Finished")
+    # read the band once so that each candidate point is a lookup
+    progress(0, myReps, "Reading layer")
+    mySampler=rasterSampler(myReader)
+
+    progress(0, myReps, "Processing...")
+
+    # loop through replicates, made in parallel but given back in order
+    for [rep, myPoints] in pseudoDist(mySampler, myPoints, myReps,
+                                      myMethod, myCurve, myRange, myDistance, mySeed,
+                                      progress, mySurface, myWorkers):
+      # write the points to the output file
+      for i in range(0,len(myPoints)):
+        myFt=QgsFeature()
+        myFt.setGeometry(QgsGeometry.fromPoint(QgsPoint(myPoints[i][0], myPoints[i][1])))
+        myFt.addAttribute(0, QVariant(rep))
+        myFt.addAttribute(1, QVariant(i))
+        myFt.addAttribute(2, QVariant(myPoints[i][0]))
+        myFt.addAttribute(3, QVariant(myPoints[i][1]))
+        myFt.addAttribute(4, QVariant(myPoints[i][2]))
+        myFt.addAttribute(5, QVariant(myPoints[i][3]))
+        myOutShape.addFeature(myFt)
+
+    # write to file
+    myOutShape=None
 
-    else:
-      self.statusLabel.setText("Error")
+  ################################################################
+  # when all the replicates are written
+  def analysisFinished(self, myResult):
 
-    self.repaint()
+    # the written file was flushed when the worker let it go
+    # load into qgis if asked
+    if self.addToToc.checkState() == Qt.Checked:
+      myVlayer = QgsVectorLayer(self.outShape.displayText(), 
+                                "PseudoDist Output", "ogr")
+      QgsMapLayerRegistry.instance().addMapLayer(myVlayer)
+
+    self.statusLabel.setText("Finished")
@@ -0,0 +1,432 @@
+"""
+/***************************************************************************
+PseudoPoints
+Part of the PseudoDist QGIS plugin
+Generate pseudo distributions of points following a model of distance
+from a random origin.  Free of any Qt/QGIS code so that it can be run
+from the dialog or the command line.
+                             -------------------
+begin                : 2010-12-20
+copyright            : (C) 2010 by Chris Yesson
+email                : chris.yesson@ioz.ac.uk
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from math import sqrt, log
+from multiprocessing import Pool, cpu_count
+from numpy import random as nprandom
+from numpy.random import RandomState
+from numpy import asarray, hypot, radians, sin, cos, arctan2, sqrt as npsqrt, minimum
+from numpy import exp, absolute, where, broadcast_arrays, float64, empty
+from numpy import nonzero, diff, concatenate, arange, clip, maximum, cumsum, searchsorted
+from numpy import bincount, isnan
+
+# WGS84 ellipsoid, semi-major axis in metres and flattening, for
+# ellipsoidDistance
+SemiMajor=6378137.0
+Flattening=1/298.257223563
+
+# number of candidate points drawn at a time
+MinBatch=1000
+MaxBatch=1000000
+
+# a point that isn't accepted within this many tries is given up on
+MaxTries=1000
+
+# largest number of cells in each block of the probability surface
+SurfaceCells=4194304
+
+# bins of cell values for the "Responsive" method, see binPoints
+ValueBins=256
+
+################################################################
+# straight line distance between x1,y1 and x2,y2 in map units
+# these take arrays of points, or single points
+def planarDistance(x1, y1, x2, y2):
+  return hypot(asarray(x2)-x1, asarray(y2)-y1)
+
+################################################################
+# distance in metres on the WGS84 ellipsoid between lon/lat points in
+# degrees, by Vincenty's inverse formula as used by QgsDistanceArea
+# measureLine, all the points are worked on at once
+# agrees with measureLine to well under a millimetre, except for
+# points nearly opposite on the globe where the formula doesn't settle
+# in 100 iterations and its last estimate is used
+def ellipsoidDistance(x1, y1, x2, y2):
+
+  [x1, y1, x2, y2]=broadcast_arrays(*[asarray(myArray, dtype=float64) for myArray in [x1, y1, x2, y2]])
+  a=SemiMajor
+  f=Flattening
+  b=a*(1-f)
+
+  L=asarray(radians(x2-x1))
+  # reduced latitudes
+  U1=arctan2((1-f)*sin(radians(y1)), cos(radians(y1)))
+  U2=arctan2((1-f)*sin(radians(y2)), cos(radians(y2)))
+  [sinU1, cosU1, sinU2, cosU2]=[sin(U1), cos(U1), sin(U2), cos(U2)]
+
+  # iterate lambda only for the points that haven't settled yet
+  myLambda=L.copy()
+  myActive=arange(L.size)
+  [sinSigma, cosSigma, sigma, cosSqAlpha, cos2SigmaM]=[empty(L.shape) for i in range(5)]
+  for i in range(100):
+    [l, u1s, u1c, u2s, u2c]=[myArray.flat[myActive] for myArray in [myLambda, sinU1, cosU1, sinU2, cosU2]]
+    [sinLambda, cosLambda]=[sin(l), cos(l)]
+    mySinSigma=npsqrt((u2c*sinLambda)**2 + (u1c*u2s-u1s*u2c*cosLambda)**2)
+    myCosSigma=u1s*u2s + u1c*u2c*cosLambda
+    mySigma=arctan2(mySinSigma, myCosSigma)
+    # coincident points have no direction
+    sinAlpha=where(mySinSigma==0, 0.0, u1c*u2c*sinLambda/where(mySinSigma==0, 1.0, mySinSigma))
+    myCosSqAlpha=1-sinAlpha**2
+    # points on the equator
+    myCos2SigmaM=where(myCosSqAlpha==0, 0.0,
+                       myCosSigma-2*u1s*u2s/where(myCosSqAlpha==0, 1.0, myCosSqAlpha))
+    C=f/16*myCosSqAlpha*(4+f*(4-3*myCosSqAlpha))
+    myNew=L.flat[myActive]+(1-C)*f*sinAlpha*(mySigma+C*mySinSigma*(myCos2SigmaM+
+                                                                   C*myCosSigma*(-1+2*myCos2SigmaM**2)))
+    for [myAll, myPart] in [[sinSigma, mySinSigma], [cosSigma, myCosSigma], [sigma, mySigma],
+                            [cosSqAlpha, myCosSqAlpha], [cos2SigmaM, myCos2SigmaM], [myLambda, myNew]]:
+      myAll.flat[myActive]=myPart
+    myActive=myActive[absolute(myNew-l)>1e-12]
+    if len(myActive)==0:
+      break
+
+  uSq=cosSqAlpha*(a*a-b*b)/(b*b)
+  A=1+uSq/16384*(4096+uSq*(-768+uSq*(320-175*uSq)))
+  B=uSq/1024*(256+uSq*(-128+uSq*(74-47*uSq)))
+  deltaSigma=B*sinSigma*(cos2SigmaM+B/4*(cosSigma*(-1+2*cos2SigmaM**2)-
+                                         B/6*cos2SigmaM*(-3+4*sinSigma**2)*(-3+4*cos2SigmaM**2)))
+  return b*A*(sigma-deltaSigma)
+
+################################################################
+# implement the probability of selection model
+# curve is one of "Gaussian", "Linear" or "Threshhold", the probability
+# falls to 0.05 (Gaussian) or 0 (Linear, Threshhold) at limit
+# dist is an array of distances, an array of probabilities is returned
+def probCurve(dist, curve, limit):
+
+  dist=asarray(dist, dtype=float)
+
+  if curve=='Gaussian':
+    # a standard gaussian equation is of the form
+    # p = y = a exp( -(x-b)^2 / 2(c^2) )
+    # a = y axis stretch (don't need unless we want p<1 when x=mean)
+    #     a = 1 gives p=1 when x=0
+    # b = offset from zero (mean) so (x-b) = distance from mean
+    # c = x axis stretch (proportional to limit)
+
+    # rescale equation so that p=0.05 when distance=limit
+    LimitRescaled=limit/sqrt(abs(log(0.05))*2)
+    p=exp(-1*(dist**2 / \
+                  (2*LimitRescaled**2)))
+
+  elif curve=='Linear':
+    # p=1 when cellvalue=OriginValue
+    # p=0 when cellvalue=OriginValue+-Limit
+    # p<0 when cellvalue more than 1 limit from Origin
+    p= (-1*absolute(dist)+limit)/limit
+
+  elif curve=="Threshhold":
+    # check environmental distance from point of origin
+    # select point if it is within one limit
+    p=(dist<limit)*1.0
+
+  return p
+
+################################################################
+# probability of selecting each of the points x,y with the given cell
+# values, 0 where valid is False (outside the layer or no data)
+# method is "Random", "Distance" (from the origin, measured with
+# distance) or "Responsive" (difference in value from the origin)
+# origin is [x, y, value], distance(x, y, x0, y0) is given arrays of
+# points and the single point x0,y0
+def choosePoint(x, y, value, valid, method, curve, limit, origin=None, distance=planarDistance):
+
+  # define the probability of selection default=1
+  prob=1.0
+
+  # check distance from origin
+  if method=="Distance":
+    prob=probCurve(distance(x, y, origin[0], origin[1]), curve, limit)
+
+  elif method=="Responsive":
+    # check environmental distance from point of origin
+    # (cells with no data are NaN, they get 0 below anyway)
+    prob=probCurve(absolute(where(valid, value, origin[2])-origin[2]), curve, limit)
+
+  # check if point is within the mask
+  return where(valid, prob, 0.0)
+
+################################################################
+# draw random points in extent in batches and accept each with the
+# probability from choosePoint, until count points are accepted
+# yields [x, y, value, p] arrays of the points accepted from each batch
+# The batches are sized from the share of points accepted so far.  The
+# tries are counted across batches as if the points were drawn one at
+# a time, and RuntimeError is raised if a point takes more than
+# maxTries, or never with maxTries=None.
+def acceptPoints(valuesAt, extent, count, method, curve, limit, origin, distance, random,
+                 maxTries=MaxTries):
+
+  [xMin, yMin, xMax, yMax]=extent
+  myFound=0
+  # tries since the last point was accepted
+  myTries=0
+  myRate=1.0
+
+  while myFound<count:
+    myN=int(min(MaxBatch, max(MinBatch, 1.2*(count-myFound)/myRate)))
+    x=xMin+(random.rand(myN)*(xMax-xMin))
+    y=yMin+(random.rand(myN)*(yMax-yMin))
+    myKeep=random.rand(myN)
+    [myValues, myValid]=valuesAt(x, y)
+    myP=choosePoint(x, y, myValues, myValid, method, curve, limit, origin, distance)
+    myKeep=nonzero(myKeep<myP)[0][:count-myFound]
+
+    # tries taken by each point accepted, and by the one to come
+    myTaken=diff(concatenate([[-1], myKeep]))
+    if len(myKeep):
+      myTaken[0]+=myTries
+      myTries=myN-1-myKeep[-1]
+    else:
+      myTries+=myN
+    if maxTries is not None and ((myTaken>maxTries).any() or \
+                                 (myFound+len(myKeep)<count and myTries>=maxTries)):
+      raise RuntimeError("Failed to find sufficient points that meet your input parameters, try increasing your distance parameter.")
+
+    myFound+=len(myKeep)
+    myRate=max(len(myKeep), 1)/float(myN)
+    yield [x[myKeep], y[myKeep], myValues[myKeep], myP[myKeep]]
+
+################################################################
+# upper bound of the probability of the points within the cells of rows
+# yStart to yStop of the layer read by sampler, as choosePoint but for
+# the nearest point of each cell to the origin for the "Distance"
+# method, so that it is never below that of any point in the cell
+# (the nearest point is taken as the origin clamped to the cell, which
+# is exact for planar distances and very nearly so on the sphere)
+def surfaceBlock(sampler, yStart, yStop, method, curve, limit, origin, distance):
+
+  myValues=sampler.values[yStart:yStop]
+  myValid=~isnan(myValues)
+  if method=="Distance":
+    # nearest point of each cell, measured as arrays of points
+    myLeft=sampler.xMin+arange(sampler.width)*sampler.xSize
+    myTop=sampler.yMax-arange(yStart, yStop)*sampler.ySize
+    [x, y]=broadcast_arrays(clip(origin[0], myLeft, myLeft+sampler.xSize)[None,:],
+                            clip(origin[1], myTop-sampler.ySize, myTop)[:,None])
+    myDistance=asarray(distance(x.ravel(), y.ravel(), origin[0], origin[1]))
+    myP=where(myValid, probCurve(myDistance.reshape(myValues.shape), curve, limit), 0.0)
+  else:
+    myP=choosePoint(None, None, myValues, myValid, method, curve, limit, origin, distance)
+  # Linear gives negative probabilities beyond the limit
+  return maximum(myP, 0.0)
+
+################################################################
+# draw count points from the probability surface of the layer read by
+# sampler (a rasterSampler) rather than by rejection
+# Cells are drawn in proportion to their value from surfaceBlock, by
+# searchsorted on the cumulative sum, first of the blocks of rows and
+# then of the cells within each block, and the point is placed
+# uniformly within the cell.  For "Distance" the point is then accepted
+# with its probability over that of the cell, which keeps the sampling
+# exact, "Random" and "Responsive" points are always accepted.
+# yields [x, y, value, p] arrays as acceptPoints
+# raises RuntimeError if there is no cell the points could fall in
+def surfacePoints(sampler, count, method, curve, limit, origin, distance, random):
+
+  myRows=max(1, SurfaceCells//sampler.width)
+  myBlocks=[[yStart, min(yStart+myRows, sampler.height)] for yStart in range(0, sampler.height, myRows)]
+  myTotals=cumsum([surfaceBlock(sampler, yStart, yStop, method, curve, limit, origin, distance).sum()
+                   for [yStart, yStop] in myBlocks])
+  if len(myTotals)==0 or myTotals[-1]<=0:
+    raise RuntimeError("Failed to find sufficient points that meet your input parameters, try increasing your distance parameter.")
+
+  myFound=0
+  myRate=1.0
+  while myFound<count:
+    myN=int(min(MaxBatch, max(1, 1.2*(count-myFound)/myRate)))
+    # blocks, then cells within them
+    myDraws=minimum(searchsorted(myTotals, random.rand(myN)*myTotals[-1], side="right"), len(myBlocks)-1)
+    myCells=[]
+    for (b, myCount) in enumerate(bincount(myDraws, minlength=len(myBlocks))):
+      if myCount==0:
+        continue
+      [yStart, yStop]=myBlocks[b]
+      myCum=cumsum(surfaceBlock(sampler, yStart, yStop, method, curve, limit, origin, distance))
+      myCells.append(minimum(searchsorted(myCum, random.rand(myCount)*myCum[-1], side="right"),
+                             len(myCum)-1)+yStart*sampler.width)
+    myCells=concatenate(myCells)
+    myCells=myCells[random.permutation(len(myCells))]
+
+    [myRow, myCol]=[myCells//sampler.width, myCells%sampler.width]
+    x=sampler.xMin+(myCol+random.rand(myN))*sampler.xSize
+    y=sampler.yMax-(myRow+random.rand(myN))*sampler.ySize
+    myValues=sampler.values[myRow, myCol]
+    myP=choosePoint(x, y, myValues, ~isnan(myValues), method, curve, limit, origin, distance)
+    if method=="Distance":
+      # accept against the probability at the nearest point of the cell
+      myLeft=sampler.xMin+myCol*sampler.xSize
+      myTop=sampler.yMax-myRow*sampler.ySize
+      myBound=probCurve(distance(clip(origin[0], myLeft, myLeft+sampler.xSize),
+                                 clip(origin[1], myTop-sampler.ySize, myTop),
+                                 origin[0], origin[1]), curve, limit)
+      myKeep=nonzero(random.rand(myN)*myBound<myP)[0]
+    else:
+      myKeep=arange(myN)
+    myKeep=myKeep[:count-myFound]
+
+    myFound+=len(myKeep)
+    myRate=max(len(myKeep), 1)/float(myN)
+    yield [x[myKeep], y[myKeep], myValues[myKeep], myP[myKeep]]
+
+################################################################
+# draw count points for the "Responsive" method from the cells of the
+# layer read by sampler grouped into bins by value (see
+# rasterSampler.valueBins, worked out once for the layer)
+# A bin is drawn in proportion to its number of cells times the highest
+# probability of any value in it, then a cell within the bin and a
+# point within the cell.  The point is accepted with its probability
+# over that of the bin, so the points are exactly as likely as by
+# rejection, but the time taken depends on the number of bins and
+# points rather than on the size of the layer.
+# yields [x, y, value, p] arrays as acceptPoints
+# raises RuntimeError if there is no cell the points could fall in
+def binPoints(sampler, count, curve, limit, origin, random):
+
+  [myLow, myHigh, myStarts, myCells]=sampler.valueBins(ValueBins)
+  myCounts=diff(myStarts)
+  # nearest value of each bin to that of the origin (empty bins have
+  # no values, they are given that of the origin and no weight)
+  [myLow, myHigh]=[where(myCounts>0, a, origin[2]) for a in [myLow, myHigh]]
+  myDistance=where(origin[2]<myLow, myLow-origin[2], where(origin[2]>myHigh, origin[2]-myHigh, 0.0))
+  myBound=where(myCounts>0, maximum(probCurve(myDistance, curve, limit), 0.0), 0.0)
+  myTotals=cumsum(myCounts*myBound)
+  if myTotals[-1]<=0:
+    raise RuntimeError("Failed to find sufficient points that meet your input parameters, try increasing your distance parameter.")
+
+  myFound=0
+  myRate=1.0
+  while myFound<count:
+    myN=int(min(MaxBatch, max(1, 1.2*(count-myFound)/myRate)))
+    myBins=minimum(searchsorted(myTotals, random.rand(myN)*myTotals[-1], side="right"), len(myTotals)-1)
+    myCell=asarray(myCells[myStarts[myBins]+(random.rand(myN)*myCounts[myBins]).astype(int)])
+    [myRow, myCol]=[myCell//sampler.width, myCell%sampler.width]
+    x=sampler.xMin+(myCol+random.rand(myN))*sampler.xSize
+    y=sampler.yMax-(myRow+random.rand(myN))*sampler.ySize
+    myValues=sampler.values[myRow, myCol]
+    myP=choosePoint(x, y, myValues, ~isnan(myValues), "Responsive", curve, limit, origin)
+    myKeep=nonzero(random.rand(myN)*myBound[myBins]<myP)[0][:count-myFound]
+
+    myFound+=len(myKeep)
+    myRate=max(len(myKeep), 1)/float(myN)
+    yield [x[myKeep], y[myKeep], myValues[myKeep], myP[myKeep]]
+
+################################################################
+# one replicate of points, using the random stream for replicate rep
+# of the master seed, so it is the same whichever process makes it
+# state is a dict of the pseudoDist arguments, see replicateSetup
+# returns a list of [x, y, value, p] starting with the origin
+def replicatePoints(state, seed, rep):
+
+  myRandom=RandomState([seed, rep])
+  sampler=state["sampler"]
+  [method, curve, limit, distance]=[state["method"], state["curve"], state["limit"], state["distance"]]
+  myExtent=[sampler.xMin, sampler.yMin, sampler.xMax, sampler.yMax]
+
+  # get random starting point
+  # any random point within the extent will do, so over-ride the selected method
+  for myOrigin in acceptPoints(sampler.valuesAt, myExtent, 1, "Random", curve, limit, None,
+                               distance, myRandom, None):
+    pass
+  myOrigin=[float(a[0]) for a in myOrigin]
+  myPoints=[myOrigin]
+
+  # accept points in batches until there are enough
+  if method=="Responsive":
+    myBatches=binPoints(sampler, state["points"]-1, curve, limit, myOrigin, myRandom)
+  elif state["surface"]:
+    myBatches=surfacePoints(sampler, state["points"]-1, method, curve, limit, myOrigin,
+                            distance, myRandom)
+  else:
+    myBatches=acceptPoints(sampler.valuesAt, myExtent, state["points"]-1, method, curve, limit,
+                           myOrigin, distance, myRandom)
+  for myBatch in myBatches:
+    myPoints.extend(zip(*[a.tolist() for a in myBatch]))
+
+  return [list(myPoint) for myPoint in myPoints]
+
+# data shared with the worker processes, see replicateInit
+replicateState=None
+
+################################################################
+# worker process set up and job
+def replicateInit(state):
+  global replicateState
+  replicateState=state
+
+def replicateWorker(job):
+  return replicatePoints(replicateState, job[0], job[1])
+
+################################################################
+# generate replicate sets of points
+# sampler gives the cell values of the layer (a rasterSampler)
+# limit is in the units of the method, for "Distance" it is given in km
+# and distance should return metres
+# each replicate has its own random stream from the master seed (a
+# random one if None), so the points only depend on the seed
+# workers is the number of processes, None for one per cpu
+# progress(done, total) is called for each replicate, if given
+# with surface=True the points after the origin are drawn from the
+# probability surface (see surfacePoints), otherwise by rejection, but
+# "Responsive" points are always drawn by value (see binPoints)
+# yields [rep, points] for each replicate in order, where points is a
+# list of [x, y, value, p] starting with the origin
+# raises RuntimeError if a point is not accepted in MaxTries tries
+def pseudoDist(sampler, points, reps=1, method="Random", curve="Gaussian",
+               limit=1000.0, distance=planarDistance, seed=None, progress=None,
+               surface=False, workers=None):
+
+  if seed is None:
+    seed=nprandom.randint(2**31-1)
+
+  if method=="Distance":
+    # range is given in km, but we want meters
+    limit=limit*1000
+
+  myState={"sampler": sampler, "points": points, "method": method, "curve": curve,
+           "limit": limit, "distance": distance, "surface": surface}
+  if method=="Responsive":
+    # once for the layer, before it is shared with the workers
+    sampler.valueBins(ValueBins)
+
+  if workers is None:
+    workers=cpu_count()
+  if workers>1 and reps>1:
+    myPool=Pool(min(workers, reps), replicateInit, (myState,))
+    try:
+      # imap keeps the replicate order
+      for rep, myPoints in enumerate(myPool.imap(replicateWorker, [[seed, rep] for rep in range(reps)])):
+        if progress:
+          progress(rep+1, reps)
+        yield [rep, myPoints]
+      myPool.close()
+    finally:
+      # stops the other replicates if the run is cancelled
+      myPool.terminate()
+      myPool.join()
+  else:
+    for rep in range(reps):
+      myPoints=replicatePoints(myState, seed, rep)
+      if progress:
+        progress(rep+1, reps)
+      yield [rep, myPoints]
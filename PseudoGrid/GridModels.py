@@ -0,0 +1,118 @@
+"""
+/***************************************************************************
+GridModels
+Part of the PseudoGrid QGIS plugin
+Models for fake environmental grids, made a strip of rows at a time.
+Free of any Qt/QGIS code so that it can be run from the dialog or the
+command line.
+                             -------------------
+begin                : 2010-12-20
+copyright            : (C) 2010 by Chris Yesson
+email                : chris.yesson@ioz.ac.uk
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from numpy import cos, sin, pi, power, int, arange, add, empty, isnan, absolute
+from numpy import random as nprandom
+
+# largest number of cells worked on at a time
+BlockCells=1048576
+
+################################################################
+# split the first axis of a grid of shape (size, other) into blocks
+# of about BlockCells, as [[from, to], ...]
+def gridBlocks(size, other):
+  myBlock=max(1, BlockCells//max(other, 1))
+  return [[ii, min(ii+myBlock, size)] for ii in range(0, size, myBlock)]
+
+################################################################
+# model values as stored in the int grid, cut towards 0
+# a value that can't be stored raises the same errors as storing the
+# values one at a time did (e.g. a fractional power of a negative sum)
+def gridInts(values):
+  if isnan(values).any():
+    raise ValueError("cannot convert float NaN to integer")
+  if not (absolute(values)<2.0**63).all():
+    raise OverflowError("cannot convert float infinity to integer")
+  return values.astype(int)
+
+################################################################
+# environmental dataset 1 - simple gradient
+# rows jjFrom to jjTo of a grid width wide, indexed [y, x] with row 0
+# at the top
+def gradientRows(width, jjFrom, jjTo, outPower=1.0):
+
+  # Simple function to create a gradient for one variable.
+  # (ii + jj) for a strip of rows at once, cast to int as each
+  # value used to be when stored
+  return gridInts(power(add.outer(arange(jjFrom, jjTo), arange(width)), outPower)+100)
+
+################################################################
+# grid with regular peaks at intervals of wavelength
+# rows jjFrom to jjTo, as gradientRows
+def regularPeakRows(width, jjFrom, jjTo, outPower=1.0, peakRepeat=1):
+
+  piWave=pi*peakRepeat
+  # sin of each column and cos of each row only need working out once
+  mySin=sin(arange(width)/piWave)
+  myCos=cos(arange(jjFrom, jjTo)/piWave)
+  return gridInts(power(add.outer(myCos, mySin),outPower)*100)
+
+################################################################
+# add noise to the grid (+/- noise % of value)
+# random is a numpy RandomState, or the numpy.random module by default
+# worked on in blocks along the first axis, which take the same random
+# numbers in the same order as drawing them for the whole grid
+def addNoise(grid, noise, random=None):
+
+  if random is None:
+    random=nprandom
+
+  myGrid=empty(grid.shape, dtype=int)
+  for [iiFrom, iiTo] in gridBlocks(*grid.shape):
+    noiseGrid=random.rand(iiTo-iiFrom, *grid.shape[1:])
+
+    # rescale to between 1+/- Noise%
+    noiseGrid*=2.0
+    noiseGrid*=noise
+    noiseGrid/=100.0
+    noiseGrid+=1.0
+    noiseGrid-=noise/100.0
+    noiseGrid*=grid[iiFrom:iiTo]
+
+    # convert back to ints as the above will convert to float
+    myGrid[iiFrom:iiTo]=noiseGrid.round()
+
+  return myGrid
+
+################################################################
+# a grid following model ("Gradient" or "Regular peaks") with noise,
+# made a strip of rows at a time so that only one strip is held
+# yields [rows, jjFrom, jjTo] top first, rows indexed [y, x], ready
+# for asciiGridWriter.write()
+# the noise is drawn row by row down the grid
+# progress(done, total) is called for each strip, if given
+def pseudoGridStrips(width, height, model="Gradient", outPower=1.0, peakRepeat=1, noise=0,
+                     random=None, progress=None):
+
+  for [jjFrom, jjTo] in gridBlocks(height, width):
+    if model=="Gradient":
+      myRows=gradientRows(width, jjFrom, jjTo, outPower)
+    elif model=="Regular peaks":
+      myRows=regularPeakRows(width, jjFrom, jjTo, outPower, peakRepeat)
+
+    if noise>0:
+      myRows=addNoise(myRows, noise, random)
+
+    if progress:
+      progress(jjTo, height)
+    yield [myRows, jjFrom, jjTo]
@@ -23,11 +23,8 @@ from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 from qgis.core import *
 from Ui_PseudoGrid import Ui_PseudoGrid
-from numpy.random import rand
-from math import sqrt, pow, log, exp
-from numpy import zeros, logical_and, cos, sin, pi, mean, power, int, array, round, std, nonzero, equal
-from numpy.random import rand, random_integers, randn, randint, normal
 from ecogis.UI_Tools import *
+from GridModels import *
 
 import resources
 
@@ -36,6 +33,9 @@ class PseudoGrid(QDialog, Ui_PseudoGrid):
   # initiate some global variables
   #debug=open("PseudoGrid.log", "w")
   debug=None
+
+  # the analysis thread while it runs
+  worker=None
   
   ################################################################
   def __init__(self, iface):
@@ -61,6 +61,9 @@ class PseudoGrid(QDialog, Ui_PseudoGrid):
   ################################################################
   # Called when "OK" button pressed (based on the Carson Farmer's PointsInPoly Plugin, 2008)
   def accept(self): 
+    # nothing to do while an analysis is running
+    if self.worker is not None and self.worker.isRunning():
+      return
     if self.rasterLayerSelect.checkSelected() and \
           self.ascOutput.checkOutFile():
       # all tests passed! Let's go on
@@ -68,6 +71,14 @@ class PseudoGrid(QDialog, Ui_PseudoGrid):
       self.repaint()
       self.runAnalysis()
 
+  ################################################################
+  # Cancel stops a running analysis, otherwise closes the dialog
+  def reject(self):
+    if self.worker is not None and self.worker.isRunning():
+      self.worker.cancel()
+    else:
+      QDialog.reject(self)
+
   ################################################################
   # Show information when the info button is pressed
   # based on about box of csw client by Alexander Bruy & Maxim Dubinin
@@ -113,59 +124,6 @@ gradient.
   ################################################################
   # analysis bit starts here
 
-  ################################################################
-  def doGradient(self):
-    # environmental dataset 1 - simple gradient
-
-    # Simple function to create a gradient for one variable.
-    for ii in range(len(self.Grid)):        ## loop through grid array
-      for jj in range(len(self.Grid[0])):   ## already cut into X x Y dimensions
-        self.Grid[ii, jj] = power((ii + jj),self.outPower.value())+100
-        if self.debug:
-          self.debug.write("x=%s,y=%s,z=%s\n" %(ii,jj,power((ii + jj),self.Power)))
-          self.debug.flush()
-
-
-  ################################################################
-  def doRegularPeak(self):
-    # grid with regular peaks at intervals of wavelength
-
-    piWave=pi*self.peakRepeatInt.value()
-    # Simple function to create a gradient for one variable.
-    for ii in range(len(self.Grid)):        ## loop through grid array
-      for jj in range(len(self.Grid[0])):   ## already cut into X x Y dimensions
-        self.Grid[ii, jj] = power(sin(ii/piWave)+cos(jj/piWave),self.outPower.value())*100
-        if self.debug:
-          self.debug.write("x=%s,y=%s,z=%s\n" %(ii,jj,(sin(ii/piWave)+cos(jj/piWave))*100))
-          self.debug.flush()
-
-  ################################################################
-  def writeascii(self):
-
-    # write out the data to a simple ascii gis-file
-    asciiheader = """ncols           %s
-nrows           %s
-xllcorner       %s
-yllcorner       %s
-cellsize        %s
-""" %(self.template.width(),
-      self.template.height(),
-      self.template.extent().xMinimum(),
-      self.template.extent().yMinimum(),
-      (self.template.extent().xMaximum()-self.template.extent().xMinimum())/self.template.width())
-
-    myOutF=open(self.outFile.displayText(), 'w')
-    myOutF.write(asciiheader)
-    # assume the array is the right shape
-    for jj in range(len(self.Grid[0])):
-      for ii in range(len(self.Grid)):
-        myOutF.write(" %s " %(self.Grid[ii,jj]))
-        myOutF.write("\n")
-        
-    myOutF.close()
-
-    return
-
   ################################################################
   def runAnalysis(self):
 
@@ -181,35 +139,45 @@ cellsize        %s
     # fetch selected raster layer
     self.template=self.rasterLayerSelected[0][0]
 
-    # Create matrix to hold the data
-    self.Grid = zeros(self.template.width()*self.template.height(), dtype=int).reshape(self.template.width(),self.template.height())
-
     if self.gradientButton.isChecked():
-      self.doGradient()
+      myModel="Gradient"
     elif self.regularPeakButton.isChecked():
-      self.doRegularPeak()
-
-    # add noise to the grid (+/- X% of value)
-    if self.outNoise.value()>0:
-      noiseGrid=rand(self.template.width(), self.template.height())
-      if self.debug:
-        self.debug.write("randomGrid=%s\n" %(noiseGrid))
-
-      # rescale to between 1+/- Noise%
-      noiseGrid=(noiseGrid*2.0*self.outNoise.value()/100.0)
-      if self.debug:
-        self.debug.write("randomGrid2=%s\n" %(noiseGrid))
-      noiseGrid=noiseGrid+1.0-(self.outNoise.value()/100.0)
-      self.Grid = self.Grid * noiseGrid
-      # convert back to ints as the above will convert to float
-      if self.debug:
-        self.debug.write("NoiseGrid=%s\n Grid%s\n" %(noiseGrid, self.Grid))
-        self.debug.flush()
-
-      self.Grid = array(self.Grid.round(), dtype=int)
-
-    # write out the grid
-    self.writeascii()
+      myModel="Regular peaks"
+
+    # the models are in GridModels.py, run in a worker thread
+    self.worker=analysisWorker(self, self.statusLabel, self.makeGrid,
+                               str(self.outFile.displayText()),
+                               self.template.width(), self.template.height(), myModel,
+                               self.outPower.value(), self.peakRepeatInt.value(),
+                               self.outNoise.value(),
+                               self.template.extent().xMinimum(),
+                               self.template.extent().yMinimum(),
+                               (self.template.extent().xMaximum()-self.template.extent().xMinimum())/self.template.width())
+    QObject.connect(self.worker, SIGNAL("analysisFinished(PyQt_PyObject)"), self.analysisFinished)
+    self.worker.start()
+
+  ################################################################
+  # run in the worker thread, so only uses its arguments
+  def makeGrid(self, myFileName, myWidth, myHeight, myModel, myPower, myRepeat, myNoise,
+               xMin, yMin, myCellSize, progress=None):
+
+    progress(0, 1, "Processing...")
+    if self.debug:
+      self.debug.write("Grid %s x %s\n" %(myWidth, myHeight))
+      self.debug.flush()
+
+    # each strip of the grid is written out as it is made
+    myWriter=asciiGridWriter(myFileName, myWidth, myHeight, xMin, yMin, myCellSize)
+    try:
+      for [myRows, jjFrom, jjTo] in pseudoGridStrips(myWidth, myHeight, myModel, myPower,
+                                                     myRepeat, myNoise, progress=progress):
+        myWriter.write(myRows)
+    finally:
+      myWriter.close()
+
+  ################################################################
+  # when the grid has been written
+  def analysisFinished(self, myResult):
 
     # load into qgis if asked
     if self.addToToc.checkState() == Qt.Checked:
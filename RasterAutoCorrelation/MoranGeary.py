@@ -0,0 +1,720 @@
+"""
+/***************************************************************************
+MoranGeary
+Part of the RasterAutoCorrelation QGIS plugin
+Numpy engine for Moran's I and Geary's C on a raster band.
+Kept free of any Qt/QGIS code so that it only needs arrays (or a
+rasterBandReader), for the dialog and the command line.
+                             -------------------
+begin                : 2011-01-10
+copyright            : (C) 2011 by Chris Yesson
+email                : chris.yesson@ioz.ac.uk
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from math import pow, ceil, hypot
+from multiprocessing import Pool, cpu_count
+from numpy import zeros, where, int64, arange, sqrt, conj, rint, concatenate, asarray
+from numpy import ceil as npceil
+from numpy import array, mean, nan, int8
+from numpy.random import RandomState
+from numpy import sum as npsum
+from numpy.fft import rfft2, irfft2
+from scipy.stats import zprob
+
+################################################################
+# spatial weights are described as a stencil, a list of
+# [row offset, column offset, weight] for the neighbours of a pixel
+#  Rook - the 4 pixels sharing a border (the default)
+#  Queen - the 8 pixels sharing a border or corner
+#  K-order - pixels up to order rook steps away
+#  Inverse distance - pixels up to order pixels away, weighted by
+#                     1/distance^power (distance in map units)
+# any other stencil can be used as long as it is symmetric, i.e. if it
+# holds [dy,dx,w] it also holds [-dy,-dx,w]
+def makeStencil(kernel="Rook", order=1, power=1.0, xSize=1.0, ySize=1.0):
+
+  myStencil=[]
+  for dy in range(-order, order+1):
+    for dx in range(-order, order+1):
+      if dy==0 and dx==0:
+        continue
+      if kernel=="Rook" and abs(dy)+abs(dx)==1:
+        myStencil.append([dy, dx, 1.0])
+      elif kernel=="Queen" and max(abs(dy), abs(dx))==1:
+        myStencil.append([dy, dx, 1.0])
+      elif kernel=="K-order" and abs(dy)+abs(dx)<=order:
+        myStencil.append([dy, dx, 1.0])
+      elif kernel=="Inverse distance" and hypot(dy, dx)<=order:
+        myStencil.append([dy, dx, 1.0/pow(hypot(dy*ySize, dx*xSize), power)])
+
+  return myStencil
+
+################################################################
+# rows of halo needed either side of a strip for a stencil
+# row standardised weights depend on the neighbours of the neighbours
+def stencilHalo(stencil, rowStandardise=False):
+  myRadius=max([abs(dy) for [dy, dx, w] in stencil])
+  if rowStandardise:
+    return 2*myRadius
+  return myRadius
+
+################################################################
+# view of array a moved so that b[y,x]=a[y+dy,x+dx], with fill where
+# that falls outside a
+def shifted(a, dy, dx, fill=0):
+  myOut=zeros(a.shape, dtype=a.dtype)
+  if fill:
+    myOut[...]=fill
+  [myH, myW]=a.shape
+  myOut[max(0,-dy):min(myH,myH-dy), max(0,-dx):min(myW,myW-dx)]= \
+      a[max(0,dy):min(myH,myH+dy), max(0,dx):min(myW,myW+dx)]
+  return myOut
+
+################################################################
+# 1/total weight of each pixel, used to row standardise the weights
+# (0 for pixels without neighbours)
+def rowStandardiseScale(mask, stencil):
+  myRowTotal=zeros(mask.shape)
+  for [dy, dx, w] in stencil:
+    myRowTotal+=w*(mask & shifted(mask, dy, dx))
+  return where(myRowTotal>0, 1.0/where(myRowTotal>0, myRowTotal, 1.0), 0.0)
+
+################################################################
+# sums needed for Moran's I and Geary's C
+# values is the band as a 2d array, mask is True where there is data
+# and m is the global mean of the layer
+# the neighbours of every pixel are shifted views of the band, one for
+# each offset in the stencil (by default the 4 rook neighbours), so each
+# pair is found by comparing the array with itself offset by dy,dx.
+# As in a pixel by pixel walk each pair is counted twice, as w(ij) and
+# w(ji).  The weight of a pair is
+#   w(ij) = stencil weight * valid(i) * valid(j) [/ row total of i]
+# so S0, S1 and S2 follow for any stencil, binary or not:
+#   S0 = sum w(ij)
+#   S1 = 1/2 sum (w(ij) + w(ji))^2
+#   S2 = sum (w(i.) + w(.i))^2
+# For a strip of a larger raster only rows first:last are summed, the
+# rows either side are the halo and just provide the neighbours (see
+# stencilHalo for how many are needed).  The sums from each strip can
+# then be added together (see addSums).
+def moranGearySums(values, mask, m, first=0, last=None, stencil=None, rowStandardise=False):
+
+  if last is None:
+    last=len(values)
+  if stencil is None:
+    stencil=makeStencil("Rook")
+  myStencilWeights=dict([((dy, dx), w) for [dy, dx, w] in stencil])
+
+  # deviations from the mean, zero where there is no data
+  myDev=where(mask, values-m, 0.0)
+  myCoreDev=myDev[first:last]
+
+  myN=int(mask[first:last].sum())
+  # denominator for Moran & Geary are the same
+  myDenominator=float(npsum(myCoreDev*myCoreDev))
+  myKNum=float(npsum(myCoreDev**4))
+
+  # row standardising divides the weights of i by their total
+  myScale=None
+  if rowStandardise:
+    myScale=rowStandardiseScale(mask, stencil)
+
+  [myNumeratorMI, myNumeratorGC, myS0, myS1]=[0.0, 0.0, 0.0, 0.0]
+  myRowSum=zeros(mask.shape)
+  myColSum=zeros(mask.shape)
+  for [dy, dx, w] in stencil:
+    # both ends of the pair must have data
+    myPairs=mask & shifted(mask, dy, dx)
+    # w(ij) where j is dy,dx from i, and w(ji) back the other way
+    myWij=w*myPairs
+    myWji=myStencilWeights.get((-dy, -dx), 0.0)*myPairs
+    if rowStandardise:
+      myWij=myWij*myScale
+      myWji=myWji*shifted(myScale, dy, dx)
+    myNeighbourDev=shifted(myDev, dy, dx)
+
+    myNumeratorMI+=float(npsum((myWij*myDev*myNeighbourDev)[first:last]))
+    myNumeratorGC+=float(npsum((myWij*(myDev-myNeighbourDev)**2)[first:last]))
+    myS0+=float(npsum(myWij[first:last]))
+    myS1+=float(npsum(((myWij+myWji)**2)[first:last]))
+    myRowSum+=myWij
+    # w(ij) counts towards the column total of j
+    myColSum+=shifted(myWij, -dy, -dx)
+
+  myS1=myS1/2
+  myS2=float(npsum(((myRowSum+myColSum)**2)[first:last]))
+
+  return [myN, myDenominator, myKNum, myNumeratorMI, myNumeratorGC,
+          myS0, myS1, myS2]
+
+################################################################
+# add together the sums from two strips of the same raster
+def addSums(sums1, sums2):
+  return [a+b for a, b in zip(sums1, sums2)]
+
+################################################################
+# turn the sums into the statistics shown in the output table
+def moranGearyStats(myN, myDenominator, myKNum, myNumeratorMI, myNumeratorGC,
+                    myS0, myS1, myS2):
+
+  # formula for Moran's I
+  # I = [ sum i=<1..n> sum j= <1..n> w(i,j) (x(i) - x(m)) (x(j) - x(m)) / 
+  #          sum i=<1..n> (x(i) - x(m))^2 ] * 
+  # #    [ n / sum i=<1..n> sum j= <1..n> w(i,j) ]
+  # where n = number of pixels, 
+  #       w(i,j) = weight (1 if j is next to i, 0 otherwise)
+  #       x(i) = value at position i
+  #       x(m) = global mean of layer
+
+  # formula for Geary's C
+  # [ sum i=<1..n> sum j= <1..n> w(i,j) (x(i) - x(j)) / 
+  #   sum i=<1..n> (x(i) - x(m))^2 ] * 
+  #  (n -1) / 2 * sum i=<1..n> sum j= <1..n> w(i,j)
+  # variables as Moran's I
+
+  # Variance Moran's I (assuming normality)
+  # Variance = [ (n^2S1 - nS2 + 3S0^2) / (S0^2(n^2-1)) ] - E^2
+  # Where
+  # S0= sum i=<1..n> sum j=<1..n> (w(ij)), i<>j
+  # S1= 1/2 sum i=<1..n> sum j=<1..n> (w(ij) + w(ji))^2, i<>j
+  # S2= sum i=<1..n> [sum j=<1..n> w(ij) + sum j=<1..n> w(ji)]^2
+  # E=Expected = 1/(N^2-1)
+  # Zscore for Moran's I assuming normality
+  # Zscore =  I-E / Variance^0.5
+
+  # Variance Moran's I (randomisation test version)
+  # Variance = [ [n((n^2-3n+3)S1 - nS2 + 3S0^2) - k((n^2-n)S1-2nS2+6S0^2)] ] /
+  #              [ (n-1)(n-2)(n-3)S0^2 ] ] - E^2
+  # Where S0,1,2,E as above
+  # k = [ (sum i=<1..n> (x(i) - x(m))^4 ) / n ] / 
+  #     [ (sum i=<1..n> (x(i) - x(m))^2 ) / n ]^2
+  # Zscore as above
+
+  # initialise variables
+  myK=0
+  [myMoranI,myVarianceMIAN,myZMIAN,myPMIAN,
+   myVarianceMIRV,myZMIRV,myPMIRV,
+   myGearyC,myVarianceGCAN,myZGCAN,myPGCAN,
+   myVarianceGCRV,myZGCRV,myPGCRV]=[None,None,None,None,None,
+                                    None,None,None,None,None,
+                                    None,None,None,None]
+
+  # now put numerator and denominator together 
+  if myDenominator==0 or myS0==0:
+    myMoranI=None
+    myGearyC=None
+  else:
+    myMoranI= float(myN)/float(myS0)*myNumeratorMI/myDenominator
+    myGearyC= float(myN-1)/(2*float(myS0))*myNumeratorGC/myDenominator
+
+    # Stats for Moran's I
+    # Expected value of Moran's I
+    myE=-1*pow(myN-1,-1)
+
+    # Variance of Moran's I Assuming Normality
+    myVarianceMIAN=(((pow(myN,2)*myS1) - (myN*myS2) + (3*(pow(myS0,2)))) /\
+                     (pow(myS0,2)*(pow(myN,2)-1))) - pow(myE,2)
+
+
+    # Variance Moran's I Randomisation Version
+    if myN>0 and myDenominator>0:
+      myK = (myKNum / myN) / pow(myDenominator / myN,2)
+      myVarianceMIRV = ((myN*((pow(myN,2)-(3*myN)+3)*myS1 - myN*myS2 + 3*pow(myS0,2)) \
+                           - myK*((pow(myN,2)-myN)*myS1-2*myN*myS2+6*pow(myS0,2))) /\
+                          ( (myN-1)*(myN-2)*(myN-3)*pow(myS0,2) )) - pow(myE,2)
+
+    if myVarianceMIAN > 0:
+      # Zscore for Moran's I assuming Normality
+      myZMIAN =  (myMoranI-myE) / pow(myVarianceMIAN,0.5)
+      # P value that Moran's I shows no significant autocorrelation
+      myPMIAN = 2*(1-zprob(myZMIAN))
+
+    if myVarianceMIRV > 0:
+      # Zscore for Moran's I randomisation version
+      myZMIRV =  (myMoranI-myE) / pow(myVarianceMIRV,0.5)
+      # P value that Moran's I shows no significant autocorrelation
+      myPMIRV = 2*(1-zprob(myZMIRV))
+
+    # Variance, z-score & p value for Geary's C
+    # Normality version
+    myVarianceGCAN = ((((2*myS1)+myS2)*(myN-1)-(4*pow(myS0,2))))/(2*(myN+1)*pow(myS0,2))
+    if myVarianceGCAN>0:
+      myZGCAN = -1*(myGearyC - 1) / pow(myVarianceGCAN,0.5)
+      myPGCAN = 2*(1-zprob(myZGCAN))
+
+    # Now the random version
+    myVarianceGCRV = ((((myN-1)*myS1)*((pow(myN,2)-(3*myN)+3-((myN-1)*myK)))) \
+                        - ((((myN-1)*myS2)*((pow(myN,2)+(3*myN)-6-((pow(myN,2)-myN+ 2)*myK))))/4) \
+                        + (pow(myS0,2)*(pow(myN,2)-3-(pow(myN-1,2)*myK)))) /\
+                        ((myN*(myN-2)*(myN-3))*pow(myS0,2))
+    if myVarianceGCRV>0:
+      myZGCRV = -1*(myGearyC - 1) / pow(myVarianceGCRV,0.5)
+      myPGCRV = 2*(1-zprob(myZGCRV))
+
+  return [myMoranI,
+          myVarianceMIAN,myZMIAN,myPMIAN,
+          myVarianceMIRV,myZMIRV,myPMIRV,
+          myGearyC,
+          myVarianceGCAN,myZGCAN,myPGCAN,
+          myVarianceGCRV,myZGCRV,myPGCRV]
+
+################################################################
+# power sums of the values with data, about a fixed shift (any value
+# near the mean, to keep rounding errors down)
+# returns [n, sum(z-shift), sum(z-shift)^2, sum(z-shift)^3, sum(z-shift)^4]
+# sums for strips of a raster can be added with addSums
+def momentSums(values, mask, shift):
+  myDev=values[mask]-shift
+  myDev2=myDev*myDev
+  return [int(mask.sum()), float(npsum(myDev)), float(npsum(myDev2)),
+          float(npsum(myDev2*myDev)), float(npsum(myDev2*myDev2))]
+
+################################################################
+# mean from the power sums
+def momentMean(moments, shift):
+  if moments[0]==0:
+    return None
+  return shift+moments[1]/moments[0]
+
+################################################################
+# sum (z-m)^2 and sum (z-m)^4 about any mean m from the power sums, i.e.
+# the denominator and kurtosis numerator used by moranGearySums
+def centredSums(moments, shift, m):
+  [myN, myS1, myS2, myS3, myS4]=moments
+  myD=m-shift
+  myDenominator=myS2 - 2*myD*myS1 + myN*myD*myD
+  myKNum=myS4 - 4*myD*myS3 + 6*myD*myD*myS2 - 4*pow(myD,3)*myS1 + myN*pow(myD,4)
+  return [myDenominator, myKNum]
+
+################################################################
+# local Moran's I (LISA, Anselin 1995) for each pixel
+#   I(i) = x(i) / m2 * sum j w(ij) x(j)
+# where x = deviation from the global mean m and m2 = denominator / n,
+# the same mean and denominator as the global statistic.  Under
+# randomisation
+#   E(I(i)) = -w(i.) / (n-1)
+#   Var(I(i)) = w(i)2 (n-b2)/(n-1) + (w(i.)^2 - w(i)2)(2b2-n)/((n-1)(n-2)) - E^2
+# with w(i)2 = sum j w(ij)^2 and b2 = kurtosis (k in moranGearyStats)
+# Cluster classes are 1 = High-High, 2 = Low-Low, 3 = High-Low and
+# 4 = Low-High (the pixel, then the weighted average of its neighbours,
+# against the mean), 0 where there is no data or no neighbours
+# As for moranGearySums, for a strip only rows first:last are returned
+# (stencilHalo rows either side are needed).
+# returns [I, z-score, cluster] arrays, NaN where there is no data
+# With no data or no variation in the layer (n or the denominator 0,
+# where moranGearyStats gives None) I and z are NaN and the cluster 0
+# for every pixel.
+def localMoran(values, mask, m, n, denominator, kNum, first=0, last=None,
+               stencil=None, rowStandardise=False):
+
+  if last is None:
+    last=len(values)
+  if stencil is None:
+    stencil=makeStencil("Rook")
+
+  if n==0 or denominator==0:
+    myNan=zeros(mask[first:last].shape)+nan
+    return [myNan, myNan.copy(), zeros(myNan.shape, dtype=int8)]
+
+  myDev=where(mask, values-m, 0.0)
+  myScale=None
+  if rowStandardise:
+    myScale=rowStandardiseScale(mask, stencil)
+
+  # weighted sum of the neighbours, total weight and sum of squared weights
+  myLag=zeros(mask.shape)
+  myWSum=zeros(mask.shape)
+  myWSq=zeros(mask.shape)
+  for [dy, dx, w] in stencil:
+    myWij=w*(mask & shifted(mask, dy, dx))
+    if rowStandardise:
+      myWij=myWij*myScale
+    myLag+=myWij*shifted(myDev, dy, dx)
+    myWSum+=myWij
+    myWSq+=myWij*myWij
+  [myDev, myLag, myWSum, myWSq, myMask]=[myDev[first:last], myLag[first:last],
+                                          myWSum[first:last], myWSq[first:last],
+                                          mask[first:last]]
+
+  myM2=float(denominator)/n
+  myB2=(float(kNum)/n)/pow(myM2,2)
+
+  myI=myDev*myLag/myM2
+  myE=-myWSum/(n-1)
+  myVariance=myWSq*(n-myB2)/(n-1) + \
+             (myWSum*myWSum-myWSq)*(2*myB2-n)/((n-1)*(n-2)) - myE*myE
+  myZ=(myI-myE)/sqrt(where(myVariance>0, myVariance, 1.0))
+
+  myCluster=zeros(myMask.shape, dtype=int8)
+  myHasNeighbours=myMask & (myWSum>0)
+  myCluster[myHasNeighbours & (myDev>0) & (myLag>0)]=1
+  myCluster[myHasNeighbours & (myDev<0) & (myLag<0)]=2
+  myCluster[myHasNeighbours & (myDev>0) & (myLag<0)]=3
+  myCluster[myHasNeighbours & (myDev<0) & (myLag>0)]=4
+
+  myI=where(myMask, myI, nan)
+  myZ=where(myMask & (myVariance>0), myZ, nan)
+
+  return [myI, myZ, myCluster]
+
+################################################################
+# smallest length >= n with no prime factors other than 2, 3 and 5
+# ffts are much quicker for these lengths
+def fastLength(n):
+  myBest=2*n
+  myP2=1
+  while myP2<myBest:
+    myP3=myP2
+    while myP3<myBest:
+      myP5=myP3
+      while myP5<n:
+        myP5*=5
+      myBest=min(myBest, myP5)
+      myP3*=3
+    myP2*=2
+  return myBest
+
+################################################################
+# sum over x of a(x) * b(x+h) for every offset h up to rows/cols away
+# uses the fft, padding just enough that offsets don't wrap around
+def crossSums(fa, fb, shape, rows, cols):
+  myFull=irfft2(conj(fa)*fb, shape)
+  # gather offsets -rows..rows, -cols..cols (negative ones wrap)
+  myFull=concatenate([myFull[-rows:], myFull[:rows+1]]) if rows else myFull[:1]
+  myFull=concatenate([myFull[:,-cols:], myFull[:,:cols+1]], axis=1) if cols else myFull[:,:1]
+  return myFull
+
+################################################################
+# spatial correlogram, Moran's I and Geary's C for a series of
+# distance classes worked out in one go
+# lags is the number of distance classes.  With no bandWidth class k
+# holds the pixels more than k-1 and up to k pixels away, so the first
+# class is the 4 rook neighbours used for the global statistics.
+# With bandWidth (in map units) class k holds pixels more than
+# (k-1)*bandWidth and up to k*bandWidth away.
+# Rather than looping over a neighbourhood for each class, the sums for
+# every offset h are autocorrelations of the mean-centred band:
+#   numerator MI(h) = sum d(x)d(x+h)
+#   numerator GC(h) = sum v(x+h)d(x)^2 + sum v(x)d(x+h)^2 - 2 sum d(x)d(x+h)
+#   w(h)            = sum v(x)v(x+h)
+# where d = deviation from the mean (0 for nodata) and v = 1 for data.
+# These come from a handful of ffts so the cost is O(n log n) whatever
+# the number of lags.
+# returns a list of [lag, distance, pairs, Moran's I, Geary's C]
+def correlogram(values, mask, m, lags, xSize=1.0, ySize=1.0, bandWidth=None):
+
+  if bandWidth is None:
+    # lags are counted in pixels
+    [xSize, ySize, bandWidth]=[1.0, 1.0, 1.0]
+
+  myDev=where(mask, values-m, 0.0)
+  myValid=mask.astype(float)
+  myDev2=myDev*myDev
+  myN=int(mask.sum())
+  myDenominator=float(npsum(myDev2))
+
+  # offsets needed to reach the furthest class
+  myMaxDist=lags*bandWidth
+  myRows=min(int(ceil(myMaxDist/ySize)), values.shape[0]-1)
+  myCols=min(int(ceil(myMaxDist/xSize)), values.shape[1]-1)
+
+  # pad so that the largest offset doesn't wrap round
+  myShape=(fastLength(values.shape[0]+myRows), fastLength(values.shape[1]+myCols))
+  myFDev=rfft2(myDev, myShape)
+  myFValid=rfft2(myValid, myShape)
+  myFDev2=rfft2(myDev2, myShape)
+
+  myMI=crossSums(myFDev, myFDev, myShape, myRows, myCols)
+  myW=rint(crossSums(myFValid, myFValid, myShape, myRows, myCols))
+  myGC=crossSums(myFDev2, myFValid, myShape, myRows, myCols) + \
+       crossSums(myFValid, myFDev2, myShape, myRows, myCols) - 2*myMI
+
+  # distance class of each offset, the centre (h=0) isn't a neighbour
+  # (the small tolerance keeps pixels exactly on a boundary in the
+  # lower class)
+  myDY=arange(-myRows, myRows+1)*ySize
+  myDX=arange(-myCols, myCols+1)*xSize
+  myDist=sqrt(myDY[:,None]**2 + myDX[None,:]**2)
+  myClass=where(myDist>0, npceil(myDist/bandWidth-1e-9), 0).astype(int64)
+
+  myOut=[]
+  for k in range(1, lags+1):
+    myInClass=(myClass==k)
+    myS0=float(npsum(myW[myInClass]))
+    if myS0>0 and myDenominator>0:
+      myMoranI=float(myN)/myS0*float(npsum(myMI[myInClass]))/myDenominator
+      myGearyC=float(myN-1)/(2*myS0)*float(npsum(myGC[myInClass]))/myDenominator
+    else:
+      [myMoranI, myGearyC]=[None, None]
+    myOut.append([k, k*bandWidth, int(myS0), myMoranI, myGearyC])
+
+  return myOut
+
+################################################################
+# Monte Carlo permutation test
+# the values with data are shuffled among the pixels with data and
+# Moran's I and Geary's C recalculated each time.  As the mask doesn't
+# change neither do the weights, S0, n or the denominator, and
+#   numerator GC = sum x(i)^2 (w(i.) + w(.i)) - 2 * numerator MI
+# (x = deviation from the mean) so each permutation only needs the MI
+# sum, which is one product of the band with each shifted view of it.
+# Permutations are done in blocks of PermutationBlock, block k always
+# uses the random stream seeded by [seed, k], so the result is the same
+# however many worker processes share the blocks out.
+
+PermutationBlock=50
+
+# data shared with the worker processes, see permutationInit
+permutationState=None
+
+################################################################
+# fixed parts of the calculation for a layer
+def permutationSetup(values, mask, m, stencil=None, rowStandardise=False):
+
+  if stencil is None:
+    stencil=makeStencil("Rook")
+
+  myDev=where(mask, values-m, 0.0)
+
+  # weights of each pixel as in moranGearySums
+  myScale=None
+  if rowStandardise:
+    myScale=rowStandardiseScale(mask, stencil)
+
+  myRowColSum=zeros(mask.shape)
+  myS0=0.0
+  for [dy, dx, w] in stencil:
+    myWij=w*(mask & shifted(mask, dy, dx))
+    if rowStandardise:
+      myWij=myWij*myScale
+    myS0+=float(npsum(myWij))
+    myRowColSum+=myWij+shifted(myWij, -dy, -dx)
+
+  myN=int(mask.sum())
+  myDenominator=float(npsum(myDev*myDev))
+
+  return {"values": myDev[mask], "mask": mask, "scale": myScale,
+          "stencil": stencil, "rowColSum": myRowColSum[mask],
+          "n": myN, "s0": myS0, "denominator": myDenominator}
+
+################################################################
+# Moran's I and Geary's C for count permutations using the random
+# stream for block number block
+def permutationBlock(state, seed, block, count):
+
+  myRandom=RandomState([seed, block])
+  myMask=state["mask"]
+  myValues=state["values"]
+  [myH, myW]=myMask.shape
+  myFactorI=float(state["n"])/state["s0"]/state["denominator"]
+  myFactorC=float(state["n"]-1)/(2*state["s0"])/state["denominator"]
+
+  myOut=[]
+  myDev=zeros(myMask.shape)
+  for i in range(count):
+    myShuffled=myRandom.permutation(myValues)
+    myDev[myMask]=myShuffled
+    myWeighted=myDev
+    if state["scale"] is not None:
+      myWeighted=myDev*state["scale"]
+
+    # sum w(ij)x(i)x(j) over each offset, using views rather than copies
+    # (pixels without data are 0 so they drop out)
+    myNumeratorMI=0.0
+    for [dy, dx, w] in state["stencil"]:
+      myNumeratorMI+=w*float(npsum(
+        myWeighted[max(0,-dy):min(myH,myH-dy), max(0,-dx):min(myW,myW-dx)] *
+        myDev[max(0,dy):min(myH,myH+dy), max(0,dx):min(myW,myW+dx)]))
+    myNumeratorGC=float(npsum(myShuffled*myShuffled*state["rowColSum"])) - 2*myNumeratorMI
+
+    myOut.append([myFactorI*myNumeratorMI, myFactorC*myNumeratorGC])
+
+  return myOut
+
+################################################################
+# worker process set up and job
+def permutationInit(state):
+  global permutationState
+  permutationState=state
+
+def permutationWorker(job):
+  return permutationBlock(permutationState, job[0], job[1], job[2])
+
+################################################################
+# pseudo p-value of an observed statistic given the permutations
+# counted on the side of the permutation mean the observation lies
+def pseudoP(observed, permuted):
+  if observed is None or len(permuted)==0:
+    return None
+  if observed>=mean(permuted):
+    myExtreme=int(npsum(permuted>=observed))
+  else:
+    myExtreme=int(npsum(permuted<=observed))
+  return float(myExtreme+1)/(len(permuted)+1)
+
+################################################################
+# permutation test for Moran's I and Geary's C
+# returns [pseudo p for I, pseudo p for C]
+# workers is the number of processes, None for one per cpu
+def permutationTest(values, mask, m, observedI, observedC, permutations=999,
+                    seed=1, workers=None, stencil=None, rowStandardise=False,
+                    progress=None):
+
+  myState=permutationSetup(values, mask, m, stencil, rowStandardise)
+  if myState["s0"]==0 or myState["denominator"]==0:
+    return [None, None]
+
+  # split into fixed blocks, so the random streams don't depend on workers
+  myJobs=[]
+  for myBlock, myStart in enumerate(range(0, permutations, PermutationBlock)):
+    myJobs.append([seed, myBlock, min(PermutationBlock, permutations-myStart)])
+
+  if workers is None:
+    workers=cpu_count()
+  myResults=[]
+  if workers>1 and len(myJobs)>1:
+    myPool=Pool(min(workers, len(myJobs)), permutationInit, (myState,))
+    try:
+      # imap keeps the block order
+      for myResult in myPool.imap(permutationWorker, myJobs):
+        myResults.append(myResult)
+        if progress:
+          progress(len(myResults), len(myJobs))
+      myPool.close()
+    finally:
+      # stops the other blocks if the run is cancelled
+      myPool.terminate()
+      myPool.join()
+  else:
+    for myJob in myJobs:
+      myResults.append(permutationBlock(myState, *myJob))
+      if progress:
+        progress(len(myResults), len(myJobs))
+
+  # results come back in block order
+  myPermuted=array([myRow for myBlockResult in myResults for myRow in myBlockResult])
+  return [pseudoP(observedI, myPermuted[:,0]), pseudoP(observedC, myPermuted[:,1])]
+
+################################################################
+# mean of the band, from the band statistics
+def bandMean(reader):
+  myStats=reader.statistics()
+  return momentMean(myStats["moments"], myStats["shift"])
+
+################################################################
+# Moran's I and Geary's C about the mean m, the band is read in strips
+# with enough halo rows either side for the weights, so that memory use
+# depends on the strip size and not the raster size
+# if writer is given (a rasterWriter with 3 bands on the grid of the
+# band) the local Moran's I, z-score and cluster are written in the same
+# pass, with the same mean and denominator as the global statistic
+# returns the 14 values of moranGearyStats
+def bandMoranGeary(reader, m, kernel="Rook", order=1, rowStandardise=False, writer=None,
+                   progress=None):
+
+  myStencil=makeStencil(kernel, order, 1.0, reader.xSize, reader.ySize)
+  # a band without data has no mean, the sums are 0 whatever it is taken
+  # to be and the statistics come out as None
+  if m is None:
+    m=0.0
+
+  if writer:
+    myStats=reader.statistics()
+    [myDenominator, myKNum]=[0.0, 0.0]
+    if myStats["n"]>0:
+      [myDenominator, myKNum]=centredSums(myStats["moments"], myStats["shift"], m)
+
+  mySums=None
+  try:
+    for [myValues, myMask, yStart, yStop, first] in reader.strips(halo=stencilHalo(myStencil, rowStandardise)):
+      myStripSums=moranGearySums(myValues, myMask, m, first, first+yStop-yStart,
+                                 myStencil, rowStandardise)
+      if mySums is None:
+        mySums=myStripSums
+      else:
+        mySums=addSums(mySums, myStripSums)
+
+      if writer:
+        myLisa=localMoran(myValues, myMask, m, myStats["n"], myDenominator, myKNum,
+                          first, first+yStop-yStart, myStencil, rowStandardise)
+        for j in range(3):
+          writer.write(j, myLisa[j], yStart)
+
+      if progress:
+        progress(yStop, reader.height)
+  finally:
+    # let go of the file even if the run is cancelled or fails
+    if writer:
+      writer.close()
+
+  return moranGearyStats(*mySums)
+
+################################################################
+# pseudo p-values for Moran's I and Geary's C by random permutation
+# of the pixel values, the whole band is needed in memory
+def bandPermutationP(reader, m, observedI, observedC, permutations=999, seed=1,
+                     workers=None, kernel="Rook", order=1, rowStandardise=False,
+                     progress=None):
+
+  [myValues, myMask]=reader.read()
+
+  return permutationTest(myValues, myMask, m, observedI, observedC,
+                         permutations, seed, workers,
+                         makeStencil(kernel, order, 1.0, reader.xSize, reader.ySize),
+                         rowStandardise, progress)
+
+################################################################
+# Moran's I and Geary's C for a series of distance classes
+# the whole band is needed in memory for the fft
+# a lag width of 0 means count lags in pixels
+def bandCorrelogram(reader, m, lags, lagWidth=0):
+
+  [myValues, myMask]=reader.read()
+
+  if lagWidth>0:
+    return correlogram(myValues, myMask, m, lags, reader.xSize, reader.ySize, lagWidth)
+  else:
+    return correlogram(myValues, myMask, m, lags)
+
+################################################################
+# all of the above for one band, as chosen in the dialog or on the
+# command line
+# reader is a rasterBandReader (or anything with the same read(),
+# strips() and statistics()), kernel and order choose the weights (see
+# makeStencil) and progress(done, total) is called as the work goes
+# along, if given
+# m is the mean, from the band statistics if not given, the
+# permutation test and correlogram are skipped for 0 permutations/lags
+# returns [mean, the 14 values of moranGearyStats, [p (perm) I,
+# p (perm) C], correlogram or None]
+def autoCorrelation(reader, m=None, kernel="Rook", order=1, rowStandardise=False,
+                    permutations=0, seed=1, workers=None, lags=0, lagWidth=0,
+                    writer=None, progress=None):
+
+  if m is None:
+    m=bandMean(reader)
+  myWeights={"kernel": kernel, "order": order, "rowStandardise": rowStandardise}
+
+  myStats=bandMoranGeary(reader, m, writer=writer, progress=progress, **myWeights)
+  [myMoran, myGeary]=[myStats[0], myStats[7]]
+
+  myPermutationP=[None, None]
+  if permutations>0 and (myMoran or myGeary):
+    myPermutationP=bandPermutationP(reader, m, myMoran, myGeary, permutations, seed,
+                                    workers, progress=progress, **myWeights)
+
+  myCorrelogram=None
+  if lags>0 and m is not None:
+    myCorrelogram=bandCorrelogram(reader, m, lags, lagWidth)
+
+  return [m, myStats, myPermutationP, myCorrelogram]
@@ -0,0 +1,165 @@
+"""
+/***************************************************************************
+CorrelationMatrix
+Part of the RasterCorrelation QGIS plugin
+Numpy engine for pairwise correlation (Schoener's D, Hellinger based I
+and Pearson's r) of a set of raster layers.
+Kept free of any Qt/QGIS code so that it only needs arrays.
+                             -------------------
+begin                : 2011-01-10
+copyright            : (C) 2011 by Chris Yesson
+email                : chris.yesson@ioz.ac.uk
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+from math import pow
+from numpy import zeros, sqrt, absolute, where, asarray, float64, nan, isnan, column_stack
+from numpy import sum as npsum
+from scipy.stats import betai
+
+################################################################
+# read all the layers together, a strip of rows at a time
+# the layers must all be on the same grid (see alignedBandReader)
+# yields a list of [values, mask] for each layer in the strip
+def stackStrips(readers, maxCells):
+
+  myWidth=readers[0].width
+  myHeight=readers[0].height
+  myRows=max(1, maxCells//(myWidth*len(readers)))
+
+  for yStart in range(0, myHeight, myRows):
+    yStop=min(yStart+myRows, myHeight)
+    yield [myReader.read(0, yStart, myWidth, yStop-yStart) for myReader in readers]
+
+################################################################
+# p-values of Pearson's r from n pairs (t-test via the incomplete beta
+# function, as scipy.stats.pearsonr), for arrays of r and n
+# NaN where there are too few pairs
+def correlationP(myCor, myN):
+  myDF=asarray(myN, dtype=float64)-2
+  myCor=asarray(myCor, dtype=float64)
+  myValid=(myDF>=1) & (absolute(myCor)<1)
+  # keep the arguments in range where the test doesn't apply
+  myDFv=where(myValid, myDF, 1.0)
+  myCorv=where(myValid, myCor, 0.0)
+  myPprelim2=myCorv**2*(myDFv/((1-myCorv)*(1+myCorv)))
+  myP=betai(0.5*myDFv,0.5,(myDFv/(myDFv+myPprelim2)))
+  myP=where(myValid, myP, nan)
+  # a perfect correlation is always significant
+  return where((myDF>=1) & (absolute(myCor)>=1), 0.0, myP)
+
+################################################################
+# pairwise correlation of every pair of layers
+# readers is a list of rasterBandReader on the same grid, ID is one of
+# "D", "I" or "R"
+# Each layer is read once (or twice if the layers don't all fit into
+# one strip of maxCells pixels and some layer totals aren't cached): the
+# per layer sums come first as D and I need them for every pair, then
+# all the pairwise sums are collected from the same strips.
+# For r the pairwise sums of every pair come from matrix products of
+# the strip (cells x layers), so the work is done by BLAS. Each pair
+# still only uses the cells where both layers are valid
+# (pairwise-complete), with X the centred values (0 where invalid) and
+# M the validity masks:
+#   sum of cross products      X'X
+#   sum of squares of layer i  (X*X)'M [i,j]
+#   sum of squares of layer j  (X*X)'M [j,i]
+#   pairs                      M'M
+# progress(done, total) is called after each strip, if given
+# returns [correlation, p] as lists of lists, [i][j] for i<j is the
+# result for layers i and j (None where it can't be calculated)
+def correlationMatrix(readers, ID, maxCells=None, progress=None):
+
+  if maxCells is None:
+    maxCells=readers[0].StripCells
+  myLayers=len(readers)
+
+  # keep the strip in memory if there is only one
+  myStrips=None
+  if max(1, maxCells//(readers[0].width*myLayers))>=readers[0].height:
+    myStrips=list(stackStrips(readers, maxCells))
+
+  # first get stats for each layer, from the statistics cache where the
+  # layer is on its own grid, so this pass is skipped for unchanged layers
+  myLayerSum=[0.0]*myLayers
+  myLayerN=[0]*myLayers
+  myMissing=[]
+  for i, myReader in enumerate(readers):
+    myStats=myReader.statistics()
+    if myStats is None:
+      myMissing.append(i)
+    else:
+      [myLayerSum[i], myLayerN[i]]=[myStats["sum"], myStats["n"]]
+  # rows done out of the rows in both passes
+  myRowsDone=0
+  myRowsTotal=readers[0].height
+  if myMissing:
+    myRowsTotal*=2
+    for myStrip in (myStrips or stackStrips(readers, maxCells)):
+      for i in myMissing:
+        [myValues, myMask]=myStrip[i]
+        myLayerSum[i]+=float(myValues[myMask].sum())
+        myLayerN[i]+=int(myMask.sum())
+      myRowsDone+=myStrip[0][0].shape[0]
+      if progress:
+        progress(myRowsDone, myRowsTotal)
+  myLayerMean=[float(myLayerSum[i])/myLayerN[i] if myLayerN[i] else None
+               for i in range(myLayers)]
+
+  # now the pairwise sums, only where both grids are valid
+  mySum=zeros((myLayers, myLayers))
+  mySumz2=zeros((myLayers, myLayers))
+  myN=zeros((myLayers, myLayers))
+  for myStrip in (myStrips or stackStrips(readers, maxCells)):
+    if ID=="R":
+      # one column per layer, one row per cell
+      myMask=column_stack([myMaskL.ravel() for [myValues, myMaskL] in myStrip]).astype(float64)
+      myX=column_stack([where(myMaskL, myValues-(myLayerMean[i] or 0.0), 0.0).ravel()
+                        for i, [myValues, myMaskL] in enumerate(myStrip)])
+      mySum+=myX.T.dot(myX)
+      mySumz2+=(myX*myX).T.dot(myMask)
+      myN+=myMask.T.dot(myMask)
+    else:
+      for i in range(myLayers):
+        [z1, myMask1]=myStrip[i]
+        for j in range(i+1, myLayers):
+          [z2, myMask2]=myStrip[j]
+          myMask=myMask1 & myMask2
+          if ID=="I":
+            mySum[i,j]+=float(npsum((sqrt(where(myMask, z1/myLayerSum[i], 0.0))-sqrt(where(myMask, z2/myLayerSum[j], 0.0)))**2))
+          elif ID=="D":
+            mySum[i,j]+=float(npsum(where(myMask, absolute(z1/myLayerSum[i] - z2/myLayerSum[j]), 0.0)))
+    myRowsDone+=myStrip[0][0].shape[0]
+    if progress:
+      progress(myRowsDone, myRowsTotal)
+
+  # final calculations
+  myCor=[[None]*myLayers for i in range(myLayers)]
+  myP=[[None]*myLayers for i in range(myLayers)]
+  if ID=="R":
+    # sums of squares of layer i and layer j over the cells of each pair
+    myVar=mySumz2*mySumz2.T
+    myR=where(myVar>0, mySum/sqrt(where(myVar>0, myVar, 1.0)), nan)
+    myRP=correlationP(myR, myN)
+  for i in range(myLayers):
+    for j in range(i+1, myLayers):
+      if ID=="I":
+        myCor[i][j]= 1 - (0.5 * pow(mySum[i,j],0.5))
+      elif ID=="D":
+        myCor[i][j]= 1 - (0.5 * mySum[i,j])
+      elif ID=="R":
+        if not isnan(myR[i,j]):
+          myCor[i][j]=float(myR[i,j])
+          if not isnan(myRP[i,j]):
+            myP[i][j]=float(myRP[i,j])
+
+  return [myCor, myP]
@@ -25,10 +25,8 @@ from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 from qgis.core import *
 from Ui_RasterCorrelation import Ui_RasterCorrelation
-from numpy.random import rand
-from math import sqrt, pow, log, exp
 from ecogis.UI_Tools import *
-from scipy.stats import zprob, betai
+from CorrelationMatrix import *
 
 class RasterCorrelation(QDialog, Ui_RasterCorrelation):
 
@@ -36,9 +34,8 @@ class RasterCorrelation(QDialog, Ui_RasterCorrelation):
   #debug=open("RasterCorrelation.log","w")
   debug=None
 
-  # define the size of the neighbourhood to examine
-  # only useful if more features are added later
-  Radius=1
+  # the analysis thread while it runs
+  worker=None
 
   ################################################################
   def __init__(self, iface):
@@ -61,10 +58,21 @@ class RasterCorrelation(QDialog, Ui_RasterCorrelation):
   ################################################################
   # Called when "OK" button pressed (based on the Carson Farmer's PointsInPoly Plugin, 2008)
   def accept(self): 
+    # nothing to do while an analysis is running
+    if self.worker is not None and self.worker.isRunning():
+      return
     if self.rasterLayerSelect.checkSelected():
       # all tests passed! Let's go on
       self.runAnalysis()
 
+  ################################################################
+  # Cancel stops a running analysis, otherwise closes the dialog
+  def reject(self):
+    if self.worker is not None and self.worker.isRunning():
+      self.worker.cancel()
+    else:
+      QDialog.reject(self)
+
   ################################################################
   # Show information when the info button is pressed
   # based on about box of csw client by Alexander Bruy & Maxim Dubinin
@@ -86,7 +94,7 @@ correlation methods are implemented.
 2. I: Another niche correlation measure outlined in Warren et al. (2008), based on Hellinger Distances.  Like Schoener's D this ranges from 0-1 and is intended for comparison of niches.
 3. Pearson's r: Often called the product moment correlation.  Output values range from 0 (no correlation) to 1 (perfect correlation).  Significance of High correlation is marked with *,** or *** indicating 0.05, 0.01 and 0.001 significance levels.
 
-Notes: The code is based on, and validated against, other implementations of these statisctics.  For D&I the R library phyloclim by Christoph Heibl was used.  For Pearson's r the python library scipy.stats function pearsonr by Gary Strangman was used.  No attempt is made to check the extent or scale of the raster layers.  The centre of each pixel on the topmost grid is used to sample all other layers.
+Notes: The code is based on, and validated against, other implementations of these statisctics.  For D&I the R library phyloclim by Christoph Heibl was used.  For Pearson's r the python library scipy.stats function pearsonr by Gary Strangman was used.  The topmost grid defines the extent and scale of the analysis: the centre of each of its pixels is used to sample all other layers, which may have a different extent or resolution (but must share its coordinate system).  The nearest pixel is used, or with Bilinear resampling the 4 nearest pixel centres are interpolated.  Pixels beyond the edge of any layer are ignored for the pairs involving that layer.
 """
     lines.addWidget( QLabel( myText ) )
 
@@ -109,105 +117,17 @@ Notes: The code is based on, and validated against, other implementations of the
   # analysis bit starts here
 
   ################################################################
-  def sumLayer(self,lyr,band):
-
-    # find sum, mean, n for layer
-    # sum values in layer
-    mySum=0.0
-    myN=0
-    myNDV=QString(u'null (no data)')
-    myOE=QString(u'out of extent')
-      
-    # get layer extents
-    xMin=lyr.extent().xMinimum()
-    xMax=lyr.extent().xMaximum()
-    yMin=lyr.extent().yMinimum()
-    yMax=lyr.extent().yMaximum()
-    xDim=lyr.width()
-    yDim=lyr.height()
-    xSize=(xMax-xMin)/float(xDim)
-    ySize=(yMax-yMin)/float(yDim)
-
-    for i in range(xDim):
-      x=xMin+(xSize/2)+(i*xSize)
-      for j in range(yDim):
-        y=yMin+(ySize/2)+(j*ySize)
-        z=lyr.identify(QgsPoint(x,y))[1].values()[band]
-          
-        # check that pixel has a value
-        if not (z==myNDV or z==myOE):
-          mySum+=float(z)
-          myN+=1
-
-    return [mySum, myN]
-
-  ################################################################
-  # get one of D,I or r correlation statistic
-  def doCorrelationIDR(self,ID,layer1,layer2):
-
-    # first get stats for each layer
-    [layer1sum, layer1n]=self.sumLayer(layer1[0],layer1[1])
-    [layer2sum, layer2n]=self.sumLayer(layer2[0],layer2[1])
-    layer1mean=layer1sum/layer1n
-    layer2mean=layer2sum/layer2n
-
-    # get layer extents based on first layer
-    xMin=layer1[0].extent().xMinimum()
-    xMax=layer1[0].extent().xMaximum()
-    yMin=layer1[0].extent().yMinimum()
-    yMax=layer1[0].extent().yMaximum()
-    xDim=layer1[0].width()
-    yDim=layer1[0].height()
-    xSize=(xMax-xMin)/float(xDim)
-    ySize=(yMax-yMin)/float(yDim)
-
-    # initialise summing variables
-    [mySum,mySumz1m,mySumz2m,myN]=[0,0,0,0]
-    myNDV=QString(u'null (no data)')
-    myOE=QString(u'out of extent')
-
-    # loop through pixels in first layer
-    for i in range(xDim):
-      x=xMin+(xSize/2)+(i*xSize)
-      for j in range(yDim):
-        y=yMin+(ySize/2)+(j*ySize)
-
-        # fetch values for this point
-        z1=layer1[0].identify(QgsPoint(x,y))[1].values()[layer1[1]]
-        z2=layer2[0].identify(QgsPoint(x,y))[1].values()[layer2[1]]
-
-        # only consider where both grids are valid
-        if not (z1==myNDV or z1==myOE or z2==myNDV or z2==myOE):
-          z1=float(z1)
-          z2=float(z2)
-          myN+=1
-          if ID=="I":
-            mySum+=pow(pow(z1/layer1sum,0.5)-pow(z2/layer2sum,0.5),2)
-          elif ID=="D":
-            mySum+=abs(z1/layer1sum - z2/layer2sum)
-          elif ID=="R":
-            z1m=z1-layer1mean
-            z2m=z2-layer2mean
-            mySum+=z1m*z2m
-            mySumz1m+=pow(z1m,2)
-            mySumz2m+=pow(z2m,2)
-    
-    [myCor,myP]=[None,None]
-    # final calculations
-    if ID=="I":
-      myCor= 1 - (0.5 * pow(mySum,0.5))
-      myP=None
-    elif ID=="D":
-      myCor= 1 - (0.5 * mySum)
-      myP=None
-    elif ID=="R":
-      if mySumz1m*mySumz1m>0:
-        myCor= mySum / (pow(mySumz1m,0.5)*pow(mySumz2m,0.5))
-        myDF=myN-2
-        myPprelim=myCor*pow(myDF/((1-myCor)*(1+myCor)),0.5)
-        myP=betai(0.5*myDF,0.5,(myDF/(myDF+pow(myPprelim,2))))
-
-    return [myCor,myP]
+  # text for the output table, with stars for significance
+  def formatCorrelation(self, myCor, myP):
+    if myCor is None:
+      return QString(u'N/A')
+    if myP is not None and myP<0.001:
+      return QString(u'%f***' %myCor)
+    if myP is not None and myP<0.01:
+      return QString(u'%f**' %myCor)
+    if myP is not None and myP<0.05:
+      return QString(u'%f*' %myCor)
+    return QString(u'%f' %myCor)
 
   ################################################################
   def runAnalysis(self):
@@ -216,7 +136,7 @@ Notes: The code is based on, and validated against, other implementations of the
     self.rasterLayerSelected=self.rasterLayerSelect.getSelected()
 
     if len(self.rasterLayerSelected)<2:
-      QMessageBox.information(self.dialog, "RasterAutoCorrelation", "Please select at least 2 raster layers to analyse")
+      QMessageBox.information(self, "RasterCorrelation", "Please select at least 2 raster layers to analyse")
 
     else:
 
@@ -235,31 +155,41 @@ Notes: The code is based on, and validated against, other implementations of the
             self.outTable.setItem(i-1,j,QTableWidgetItem())
 
 
-      # loop through selected layers
-      for i in range(len(self.rasterLayerSelected)):
-        self.statusLabel.setText("Processing %s/%s" %(i+1,len(self.rasterLayerSelected)))
-        for j in range(i+1,(len(self.rasterLayerSelected))):
-          # add more rows to the output table if required
-          myCor=None
-          if self.methodDButton.isChecked():
-            [myCor,myP]=self.doCorrelationIDR("D", self.rasterLayerSelected[i],self.rasterLayerSelected[j])
-          elif self.methodIButton.isChecked():
-            [myCor,myP]=self.doCorrelationIDR("I", self.rasterLayerSelected[i],self.rasterLayerSelected[j])
-          elif self.methodRButton.isChecked():
-            [myCor,myP]=self.doCorrelationIDR("R", self.rasterLayerSelected[i],self.rasterLayerSelected[j])
-            
-          if myP:
-            if myP<0.001:
-              myQStr=QString(u'%f***' %(myCor,myP))
-            if myP<0.01:
-              myQStr=QString(u'%f**' %(myCor,myP))
-            if myP<0.05:
-              myQStr=QString(u'%f*' %(myCor,myP))
-          else:
-            myQStr=QString(u'%f' %myCor)
-          self.outTable.item(i,j-1).setText(myQStr)
-          self.repaint()
-
-      self.statusLabel.setText("Finished")
-      self.repaint()
+      # work out the method
+      if self.methodDButton.isChecked():
+        ID="D"
+      elif self.methodIButton.isChecked():
+        ID="I"
+      elif self.methodRButton.isChecked():
+        ID="R"
+
+      # every pair in one go in a worker thread
+      myLayers=[[str(myLayer.source()), myBand] for [myLayer, myBand] in self.rasterLayerSelected]
+      self.worker=analysisWorker(self, self.statusLabel, self.correlateLayers, myLayers, ID,
+                                 self.bilinearCheck.isChecked())
+      QObject.connect(self.worker, SIGNAL("analysisFinished(PyQt_PyObject)"), self.showResults)
+      self.worker.start()
+
+  ################################################################
+  # run in the worker thread, so only uses its arguments
+  # myLayers is a list of [source, band], each layer is read once
+  def correlateLayers(self, myLayers, ID, myBilinear, progress=None):
+
+    progress(0, 1, "Processing %s layers" %len(myLayers))
+    myReaders=[rasterBandReader(mySource, myBand) for [mySource, myBand] in myLayers]
+    # sample the other layers on the grid of the first
+    myReaders[1:]=[alignedBandReader(myReader, myReaders[0], myBilinear)
+                   for myReader in myReaders[1:]]
+
+    return correlationMatrix(myReaders, ID, progress=progress)
+
+  ################################################################
+  # fill in the output table when the analysis has finished
+  def showResults(self, myResults):
+
+    [myCor, myP]=myResults
+    for i in range(len(myCor)):
+      for j in range(i+1,(len(myCor))):
+        self.outTable.item(i,j-1).setText(self.formatCorrelation(myCor[i][j], myP[i][j]))
 
+    self.statusLabel.setText("Finished")
@@ -1,6 +1,9 @@
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 from qgis.core import *
+from time import time
+# raster reading and writing, kept free of Qt so it can run headless
+from GIS_Tools import *
 
 ################################################################
 ## class to handle an output shape file box
@@ -125,3 +128,85 @@ class rasterLayerSelect:
               myOut.append([layer,myBand])
 
     return myOut
+
+################################################################
+## class to run an analysis in its own thread so that QGIS keeps
+## responding while it works
+## give it the dialog, the status label and the function to run with
+## its arguments, then start() it
+## the function is called with a progress(done, total, message=None)
+## keyword argument to call as it goes: this shows the progress on the
+## status label, at most every UpdateInterval seconds, and raises
+## analysisCancelled once cancel() has been called
+## when it is done the worker emits one of
+##   analysisFinished(PyQt_PyObject) with the value returned
+##   analysisFailed(QString) with the error (shown in a message box)
+##   analysisCancelled()
+## the function runs outside the GUI thread so must not touch widgets,
+## nor the providers of the layers loaded in QGIS: it should open the
+## data sources it needs (and any output files) for itself
+class analysisWorker(QThread):
+
+  # seconds between updates of the status label
+  UpdateInterval=0.5
+
+  def __init__(self, Dialog, statusLabel, function, *args, **kwargs):
+    QThread.__init__(self, Dialog)
+    self.Dialog=Dialog
+    self.statusLabel=statusLabel
+    self.function=function
+    self.args=args
+    self.kwargs=kwargs
+    self.cancelled=False
+    self.message=""
+    self.lastUpdate=0
+    QObject.connect(self, SIGNAL("analysisProgress(QString)"), self.statusLabel.setText)
+    QObject.connect(self, SIGNAL("analysisFailed(QString)"), self.showError)
+    QObject.connect(self, SIGNAL("analysisCancelled()"), self.showCancelled)
+
+  ################################################################
+  # ask the analysis to stop at its next progress call
+  def cancel(self):
+    self.cancelled=True
+
+  ################################################################
+  # called from the analysis as it goes
+  def progress(self, done, total, message=None):
+    if self.cancelled:
+      raise analysisCancelled()
+
+    # always show a new message, otherwise only every UpdateInterval
+    if message is not None and message!=self.message:
+      self.message=message
+    elif time()-self.lastUpdate<self.UpdateInterval:
+      return
+    self.lastUpdate=time()
+
+    if total:
+      self.emit(SIGNAL("analysisProgress(QString)"), QString(u"%s %i%%" %(self.message, 100*done/total)))
+    else:
+      self.emit(SIGNAL("analysisProgress(QString)"), QString(self.message))
+
+  ################################################################
+  def run(self):
+    try:
+      mySignal=[SIGNAL("analysisFinished(PyQt_PyObject)"),
+                self.function(*self.args, progress=self.progress, **self.kwargs)]
+    except analysisCancelled:
+      mySignal=[SIGNAL("analysisCancelled()")]
+    except Exception, e:
+      mySignal=[SIGNAL("analysisFailed(QString)"), QString(str(e))]
+
+    # let go of the arguments (and any files they hold open) first
+    self.args=None
+    self.kwargs=None
+    self.emit(*mySignal)
+
+  ################################################################
+  def showError(self, myError):
+    self.statusLabel.setText("Error")
+    QMessageBox.information(self.Dialog, self.Dialog.windowTitle(), myError)
+
+  ################################################################
+  def showCancelled(self):
+    self.statusLabel.setText("Cancelled")
@@ -0,0 +1,262 @@
+"""
+/***************************************************************************
+EcoGIS command line
+Run the EcoGIS tools without QGIS or a display, e.g.
+  python -m ecogis rasterautocorrelation layer.tif --permutations 999
+  python -m ecogis rastercorrelation a.tif b.tif c.tif --method R
+Use python -m ecogis <tool> --help for the options of each tool.
+                             -------------------
+begin                : 2011-01-10
+copyright            : (C) 2011 by Chris Yesson
+email                : chris.yesson@ioz.ac.uk
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import argparse
+import csv
+import sys
+from numpy import arange
+from numpy.random import RandomState
+from GIS_Tools import *
+from pseudodist.PseudoPoints import pseudoDist, planarDistance, ellipsoidDistance
+from pseudogrid.GridModels import pseudoGridStrips
+from pointgridsubsample.GridSubsample import gridSubsample, gridRuns, isSelected
+from rastercorrelation.CorrelationMatrix import correlationMatrix
+from rasterautocorrelation.MoranGeary import autoCorrelation
+
+################################################################
+# text for a value that may be missing
+def formatValue(myValue):
+  if myValue is None:
+    return "N/A"
+  return "%f" %myValue
+
+################################################################
+def runPseudoDist(args):
+
+  myReader=rasterSampler(rasterBandReader(args.raster, args.band-1))
+  if args.geographic:
+    myDistance=ellipsoidDistance
+  else:
+    myDistance=planarDistance
+
+  myOut=csv.writer(open(args.output, "wb"))
+  myOut.writerow(["Replicate", "ID", "X", "Y", "Value", "p"])
+  for [rep, myPoints] in pseudoDist(myReader, args.points, args.reps, args.method, args.curve,
+                                    args.range, myDistance, args.seed,
+                                    surface=args.surface, workers=args.workers):
+    for i, myPoint in enumerate(myPoints):
+      myOut.writerow([rep, i]+myPoint)
+
+################################################################
+def runPseudoGrid(args):
+
+  myTemplate=rasterBandReader(args.template, 0)
+  myWriter=asciiGridWriter(args.output, myTemplate.width, myTemplate.height,
+                           myTemplate.xMin, myTemplate.yMin, myTemplate.xSize)
+  try:
+    for [myRows, jjFrom, jjTo] in pseudoGridStrips(myTemplate.width, myTemplate.height,
+                                                   args.model, args.power, args.repeat,
+                                                   args.noise, RandomState(args.seed)):
+      myWriter.write(myRows)
+  finally:
+    myWriter.close()
+
+################################################################
+def runPointGridSubsample(args):
+
+  myTemplate=rasterBandReader(args.template, 0)
+  myGrid=[myTemplate.xMin, myTemplate.yMin, myTemplate.xSize, myTemplate.ySize]
+  if args.on_disk:
+    runPointGridSubsampleOnDisk(args, myGrid)
+    return
+
+  myIn=csv.reader(open(args.points, "rb"))
+  myHeader=myIn.next()
+  myRows=list(myIn)
+  [xCol, yCol]=[myHeader.index(args.x), myHeader.index(args.y)]
+
+  myOut=csv.writer(open(args.output, "wb"))
+  myOut.writerow(myHeader)
+  for i in gridSubsample([float(myRow[xCol]) for myRow in myRows],
+                         [float(myRow[yCol]) for myRow in myRows],
+                         *myGrid, random=RandomState(args.seed), perCell=args.per_cell):
+    myOut.writerow(myRows[i])
+
+################################################################
+# the same for files too big to hold in memory, the points are read
+# twice: once to choose the rows, then again to write them out
+def runPointGridSubsampleOnDisk(args, myGrid, myChunkSize=100000):
+
+  myIn=csv.reader(open(args.points, "rb"))
+  myHeader=myIn.next()
+  [xCol, yCol]=[myHeader.index(args.x), myHeader.index(args.y)]
+  myRuns=gridRuns(*myGrid, perCell=args.per_cell, random=RandomState(args.seed))
+  try:
+    [myX, myY]=[[], []]
+    for myRow in myIn:
+      myX.append(float(myRow[xCol]))
+      myY.append(float(myRow[yCol]))
+      if len(myX)==myChunkSize:
+        myRuns.add(myX, myY)
+        [myX, myY]=[[], []]
+    myRuns.add(myX, myY)
+    mySelected=myRuns.selected()
+  finally:
+    myRuns.close()
+
+  myIn=csv.reader(open(args.points, "rb"))
+  myOut=csv.writer(open(args.output, "wb"))
+  myOut.writerow(myIn.next())
+  myRows=[]
+  myDone=0
+  for myRow in myIn:
+    myRows.append(myRow)
+    if len(myRows)==myChunkSize:
+      writeChosen(myOut, myRows, myDone, mySelected)
+      myDone+=len(myRows)
+      myRows=[]
+  writeChosen(myOut, myRows, myDone, mySelected)
+
+################################################################
+# write the rows of a chunk starting at row myStart that are in the
+# sorted array mySelected
+def writeChosen(myOut, myRows, myStart, mySelected):
+  myChosen=isSelected(arange(myStart, myStart+len(myRows)), mySelected)
+  myOut.writerows([myRow for (myRow, myKeep) in zip(myRows, myChosen) if myKeep])
+
+################################################################
+def runRasterCorrelation(args):
+
+  # sample the other layers on the grid of the first
+  myReaders=[rasterBandReader(myRaster, args.band-1) for myRaster in args.rasters]
+  myReaders[1:]=[alignedBandReader(myReader, myReaders[0], args.bilinear)
+                 for myReader in myReaders[1:]]
+  [myCor, myP]=correlationMatrix(myReaders, args.method)
+
+  print "\t".join(["layer1", "layer2", args.method, "p"])
+  for i in range(len(args.rasters)):
+    for j in range(i+1, len(args.rasters)):
+      print "\t".join([args.rasters[i], args.rasters[j],
+                       formatValue(myCor[i][j]), formatValue(myP[i][j])])
+
+################################################################
+def runRasterAutoCorrelation(args):
+
+  myWeights={"kernel": args.weights, "order": args.order,
+             "rowStandardise": args.row_standardise}
+  myLabels=["Mean", "Moran's I",
+            "Variance (N)", "Z-score (N)", "p (N)",
+            "Variance (R)", "Z-score (R)", "p (R)",
+            "Geary's C",
+            "Variance (N)", "Z-score (N)", "p (N)",
+            "Variance (R)", "Z-score (R)", "p (R)",
+            "p (perm) I", "p (perm) C"]
+
+  print "\t".join(["Layer"]+myLabels)
+  for i, myRaster in enumerate(args.rasters):
+    myReader=rasterBandReader(myRaster, args.band-1)
+
+    # LISA output, numbered if there is more than one layer
+    myWriter=None
+    if args.lisa:
+      myLisaFile=args.lisa
+      if len(args.rasters)>1:
+        myLisaFile="%s_%i.tif" %(myLisaFile[:-4], i+1)
+      myWriter=rasterWriter(myLisaFile, myReader, 3)
+
+    [myMean, myStats, myPerm, myCorrelogram]=autoCorrelation(
+      myReader, writer=myWriter, permutations=args.permutations, seed=args.seed,
+      workers=args.workers, lags=args.lags, lagWidth=args.lag_width, **myWeights)
+    print "\t".join([myRaster]+[formatValue(myValue) for myValue in [myMean]+list(myStats)+list(myPerm)])
+
+    if myCorrelogram is not None:
+      print "\t".join(["Lag", "Distance", "Pairs", "Moran's I", "Geary's C"])
+      for myRow in myCorrelogram:
+        print "\t".join([formatValue(myValue) for myValue in myRow])
+
+################################################################
+def main(argv=None):
+
+  myParser=argparse.ArgumentParser(prog="python -m ecogis",
+                                   description="EcoGIS tools without QGIS")
+  myTools=myParser.add_subparsers(dest="tool")
+
+  myTool=myTools.add_parser("pseudodist", help="pseudo distributions of points")
+  myTool.add_argument("raster")
+  myTool.add_argument("output", help="csv file of points")
+  myTool.add_argument("--band", type=int, default=1)
+  myTool.add_argument("--points", type=int, default=10)
+  myTool.add_argument("--reps", type=int, default=1)
+  myTool.add_argument("--method", choices=["Random", "Distance", "Responsive"], default="Random")
+  myTool.add_argument("--curve", choices=["Gaussian", "Linear", "Threshhold"], default="Gaussian")
+  myTool.add_argument("--range", type=float, default=1000.0,
+                      help="limit of the curve, in km for the Distance method")
+  myTool.add_argument("--geographic", action="store_true",
+                      help="the raster is in degrees of longitude/latitude")
+  myTool.add_argument("--surface", action="store_true",
+                      help="draw the points from the probability surface, not by rejection")
+  myTool.add_argument("--seed", type=int)
+  myTool.add_argument("--workers", type=int, help="processes for the replicates, one per cpu by default")
+  myTool.set_defaults(run=runPseudoDist)
+
+  myTool=myTools.add_parser("pseudogrid", help="fake environmental grids")
+  myTool.add_argument("template", help="raster giving the extent of the grid")
+  myTool.add_argument("output", help="ascii grid file")
+  myTool.add_argument("--model", choices=["Gradient", "Regular peaks"], default="Gradient")
+  myTool.add_argument("--power", type=float, default=1.0)
+  myTool.add_argument("--repeat", type=int, default=1, help="peak repeat interval")
+  myTool.add_argument("--noise", type=int, default=5, help="random noise in %%")
+  myTool.add_argument("--seed", type=int)
+  myTool.set_defaults(run=runPseudoGrid)
+
+  myTool=myTools.add_parser("pointgridsubsample", help="N points per grid cell")
+  myTool.add_argument("template", help="raster giving the grid cells")
+  myTool.add_argument("points", help="csv file of points with a header")
+  myTool.add_argument("output", help="csv file of the chosen points")
+  myTool.add_argument("--x", default="X", help="x column")
+  myTool.add_argument("--y", default="Y", help="y column")
+  myTool.add_argument("--per-cell", type=int, default=1, help="points to keep per cell")
+  myTool.add_argument("--on-disk", action="store_true",
+                      help="sort on disk, for more points than fit in memory")
+  myTool.add_argument("--seed", type=int)
+  myTool.set_defaults(run=runPointGridSubsample)
+
+  myTool=myTools.add_parser("rastercorrelation", help="correlation of raster grids")
+  myTool.add_argument("rasters", nargs="+", help="2 or more rasters, the first defines the grid")
+  myTool.add_argument("--band", type=int, default=1)
+  myTool.add_argument("--method", choices=["D", "I", "R"], default="D")
+  myTool.add_argument("--bilinear", action="store_true")
+  myTool.set_defaults(run=runRasterCorrelation)
+
+  myTool=myTools.add_parser("rasterautocorrelation", help="Moran's I and Geary's C")
+  myTool.add_argument("rasters", nargs="+")
+  myTool.add_argument("--band", type=int, default=1)
+  myTool.add_argument("--weights", choices=["Rook", "Queen", "K-order", "Inverse distance"], default="Rook")
+  myTool.add_argument("--order", type=int, default=1)
+  myTool.add_argument("--row-standardise", action="store_true")
+  myTool.add_argument("--permutations", type=int, default=0)
+  myTool.add_argument("--seed", type=int, default=1)
+  myTool.add_argument("--workers", type=int)
+  myTool.add_argument("--lags", type=int, default=0, help="correlogram lags, 0 for none")
+  myTool.add_argument("--lag-width", type=float, default=0.0,
+                      help="lag width in map units, 0 for pixels")
+  myTool.add_argument("--lisa", help="GeoTIFF for the local Moran's I")
+  myTool.set_defaults(run=runRasterAutoCorrelation)
+
+  args=myParser.parse_args(argv)
+  if args.tool=="rastercorrelation" and len(args.rasters)<2:
+    myParser.error("Please select at least 2 raster layers to analyse")
+  args.run(args)
+
+if __name__=="__main__":
+  main()
@@ -0,0 +1,111 @@
+"""
+/***************************************************************************
+test_AsciiGrid
+Tests for the ascii grid (AAIGrid) writer and reader of GIS_Tools, run
+from the plugin directory with
+  python -m unittest discover -s tests
+                             -------------------
+begin                : 2010-12-20
+copyright            : (C) 2010 by Chris Yesson
+email                : chris.yesson@ioz.ac.uk
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import sys
+import unittest
+from tempfile import mkdtemp
+from shutil import rmtree
+from numpy import nan, isnan, concatenate
+from numpy.random import RandomState
+
+# GIS_Tools is Qt-free, it only needs gdal
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from GIS_Tools import asciiGridWriter, asciiGridStrips, readAsciiGrid
+
+################################################################
+class asciiGridTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory=mkdtemp(prefix="asciigrid")
+    self.random=RandomState(1)
+
+  def tearDown(self):
+    rmtree(self.directory)
+
+  # write rows a few at a time, as PseudoGrid does
+  def writeGrid(self, myRows, noData=None, fmt=None, block=3):
+    myFile=os.path.join(self.directory, "grid.asc")
+    myWriter=asciiGridWriter(myFile, myRows.shape[1], myRows.shape[0], 1.5, -2.0, 0.25,
+                             fmt, noData)
+    try:
+      for yStart in range(0, len(myRows), block):
+        myWriter.write(myRows[yStart:yStart+block])
+    finally:
+      myWriter.close()
+    return myFile
+
+  def testIntegers(self):
+    myRows=self.random.randint(-1000, 1000, size=(23, 7))
+    [myValues, myMask, myHeader]=readAsciiGrid(self.writeGrid(myRows))
+    self.assertTrue((myValues==myRows).all())
+    self.assertTrue(myMask.all())
+    self.assertEqual(myHeader, {"ncols": 7, "nrows": 23, "xllcorner": 1.5, "yllcorner": -2.0,
+                                "cellsize": 0.25, "NODATA_value": None})
+
+  def testFloatsWithNoData(self):
+    # floats read back exactly, NaN is written as NODATA_value
+    myRows=self.random.randn(11, 13)*1e5
+    myRows[0,0]=nan
+    myRows[5,7]=nan
+    [myValues, myMask, myHeader]=readAsciiGrid(self.writeGrid(myRows, noData=-9999))
+    self.assertEqual(myHeader["NODATA_value"], -9999)
+    self.assertTrue((myMask==~isnan(myRows)).all())
+    self.assertTrue((myValues[myMask]==myRows[myMask]).all())
+
+  def testFormat(self):
+    myRows=self.random.rand(4, 5)
+    myFile=self.writeGrid(myRows, fmt="%.3f")
+    [myValues, myMask, myHeader]=readAsciiGrid(myFile)
+    self.assertTrue((abs(myValues-myRows)<=0.0005).all())
+    # one line of the header for each key, then a line for each row
+    self.assertEqual(len(open(myFile).readlines()), 5+4)
+
+  def testStrips(self):
+    # small blocks and buffers cut numbers and rows across reads
+    myRows=self.random.randint(0, 100000, size=(37, 9))
+    myFile=self.writeGrid(myRows, block=5)
+    for [myCells, myBuffer] in [[9, 7], [20, 16], [1000, 1048576]]:
+      myStrips=asciiGridStrips(myFile, myCells, myBuffer)
+      self.assertEqual(myStrips.next()["nrows"], 37)
+      myBlocks=list(myStrips)
+      self.assertEqual([yStart for [myValues, myMask, yStart, yStop] in myBlocks],
+                       range(0, 37, max(1, myCells//9)))
+      self.assertTrue((concatenate([myBlock[0] for myBlock in myBlocks])==myRows).all())
+
+  def testTruncated(self):
+    myFile=self.writeGrid(self.random.randint(0, 10, size=(6, 6)))
+    myText=open(myFile).read()
+    open(myFile, "w").write(myText[:-20])
+    self.assertRaises(ValueError, readAsciiGrid, myFile)
+
+  def testCentre(self):
+    # corners given as the centre of the lower left cell
+    myFile=os.path.join(self.directory, "centre.asc")
+    open(myFile, "w").write("ncols 2\nnrows 2\nxllcenter 10.5\nyllcenter 20.5\n"
+                            "cellsize 1\nnodata_value -1\n1 2\n-1 4\n")
+    [myValues, myMask, myHeader]=readAsciiGrid(myFile)
+    self.assertEqual([myHeader["xllcorner"], myHeader["yllcorner"]], [10.0, 20.0])
+    self.assertEqual(myMask.tolist(), [[True, True], [False, True]])
+
+if __name__=="__main__":
+  unittest.main()
@@ -0,0 +1,125 @@
+"""
+/***************************************************************************
+test_GridSubsample
+Tests for the point subsampling of the PointGridSubsample plugin, run
+from the plugin directory with
+  python -m unittest discover -s tests
+                             -------------------
+begin                : 2011-01-10
+copyright            : (C) 2011 by Chris Yesson
+email                : chris [dot] yesson [at] ioz [dot] ac [dot] uk
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import sys
+import unittest
+from math import floor
+from numpy import arange, concatenate
+from numpy.random import RandomState
+
+# the cores are Qt-free, so can be imported straight from their folders
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                                "PointGridSubsample"))
+from GridSubsample import gridReservoir, gridRuns, gridSubsample, isSelected
+
+# grid of 2 x 1.5 cells from -3,-2
+Grid=[-3.0, -2.0, 2.0, 1.5]
+
+################################################################
+# the points chosen one by one: each point gets the next random
+# priority in turn and each cell keeps its perCell lowest
+def bruteSubsample(x, y, perCell, seed):
+  myPriority=RandomState(seed).rand(len(x))
+  myCells={}
+  for i in range(len(x)):
+    myCell=(floor((x[i]-Grid[0])/Grid[2]), floor((y[i]-Grid[1])/Grid[3]))
+    myCells.setdefault(myCell, []).append((myPriority[i], i))
+  myChosen=[]
+  for myPoints in myCells.values():
+    myChosen+=[i for (myP, i) in sorted(myPoints)[:perCell]]
+  return sorted(myChosen)
+
+################################################################
+class gridSubsampleTest(unittest.TestCase):
+
+  def setUp(self):
+    myRandom=RandomState(7)
+    # some cells crowded, some with a single point, some off the grid
+    self.x=concatenate([myRandom.rand(400)*10-3, myRandom.rand(30)*100-50])
+    self.y=concatenate([myRandom.rand(400)*6-2, myRandom.rand(30)*100-50])
+
+  def testOneShot(self):
+    for perCell in [1, 2, 5]:
+      myChosen=gridSubsample(self.x, self.y, *Grid, random=RandomState(3), perCell=perCell)
+      self.assertEqual(myChosen.tolist(), bruteSubsample(self.x, self.y, perCell, 3))
+
+  def testChunks(self):
+    # the same points whatever the chunk size, and add() gives back
+    # exactly the ids that fall out of the reservoir
+    for perCell in [1, 3]:
+      myExpected=bruteSubsample(self.x, self.y, perCell, 5)
+      for myChunk in [1, 7, 50, 1000]:
+        myReservoir=gridReservoir(*Grid, perCell=perCell, random=RandomState(5))
+        myKept=set()
+        for myStart in range(0, len(self.x), myChunk):
+          myDropped=myReservoir.add(self.x[myStart:myStart+myChunk],
+                                    self.y[myStart:myStart+myChunk]).tolist()
+          self.assertEqual(len(myDropped), len(set(myDropped)))
+          myNew=set(range(myStart, min(myStart+myChunk, len(self.x))))
+          # dropped ids are new points or ones kept before
+          self.assertTrue(set(myDropped)<=(myKept|myNew))
+          myKept=(myKept|myNew)-set(myDropped)
+          self.assertEqual(sorted(myKept), myReservoir.selected().tolist())
+        self.assertEqual(myReservoir.selected().tolist(), myExpected)
+        self.assertEqual(myReservoir.count, len(self.x))
+
+  def testIds(self):
+    # ids given with the points are what is chosen
+    myIds=arange(len(self.x))*10+1
+    myReservoir=gridReservoir(*Grid, perCell=2, random=RandomState(5))
+    myReservoir.add(self.x, self.y, myIds)
+    self.assertEqual(myReservoir.selected().tolist(),
+                     [i*10+1 for i in bruteSubsample(self.x, self.y, 2, 5)])
+
+  def testRuns(self):
+    # small runs so that several are saved and merged, with chunks that
+    # don't line up with them
+    for perCell in [1, 2]:
+      myExpected=bruteSubsample(self.x, self.y, perCell, 11)
+      myRuns=gridRuns(*Grid, perCell=perCell, random=RandomState(11))
+      myRuns.RunSize=40
+      myRuns.BlockSize=3
+      try:
+        for myStart in range(0, len(self.x), 17):
+          myRuns.add(self.x[myStart:myStart+17], self.y[myStart:myStart+17],
+                     arange(myStart, min(myStart+17, len(self.x))))
+        self.assertTrue(len(myRuns.runs)>3)
+        self.assertEqual(myRuns.selected().tolist(), myExpected)
+      finally:
+        myDirectory=myRuns.directory
+        myRuns.close()
+      self.assertFalse(os.path.exists(myDirectory))
+
+  def testEmpty(self):
+    myReservoir=gridReservoir(*Grid, random=RandomState(1))
+    self.assertEqual(myReservoir.add([], []).tolist(), [])
+    self.assertEqual(myReservoir.selected().tolist(), [])
+
+  def testIsSelected(self):
+    mySelected=arange(0, 20, 3)
+    self.assertEqual(isSelected([0, 1, 3, 18, 19, 25], mySelected).tolist(),
+                     [True, False, True, True, False, False])
+    self.assertEqual(isSelected([1, 2], mySelected[:0]).tolist(), [False, False])
+
+if __name__=="__main__":
+  unittest.main()
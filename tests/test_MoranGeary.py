@@ -0,0 +1,212 @@
+"""
+/***************************************************************************
+test_MoranGeary
+Tests for the Moran's I and Geary's C engine of the RasterAutoCorrelation
+plugin, run from the plugin directory with
+  python -m unittest discover -s tests
+                             -------------------
+begin                : 2011-01-10
+copyright            : (C) 2011 by Chris Yesson
+email                : chris.yesson@ioz.ac.uk
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import sys
+import unittest
+from math import hypot, sqrt
+from numpy import zeros, full, isnan, nonzero, outer
+from numpy.random import RandomState
+
+# the cores are Qt-free, so can be imported straight from their folders
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                                "RasterAutoCorrelation"))
+from MoranGeary import makeStencil, stencilHalo, moranGearySums, moranGearyStats
+from MoranGeary import localMoran, addSums
+
+# [kernel, order, power, xSize, ySize] of the weights tested
+Kernels=[["Rook", 1, 1.0, 1.0, 1.0],
+         ["Queen", 1, 1.0, 1.0, 1.0],
+         ["K-order", 2, 1.0, 1.0, 1.0],
+         ["K-order", 3, 1.0, 1.0, 1.0],
+         ["Inverse distance", 2, 1.0, 2.0, 3.0],
+         ["Inverse distance", 3, 2.0, 1.0, 1.0]]
+
+################################################################
+# weight between two pixels dy rows and dx columns apart, straight
+# from the definition of each kernel
+def pairWeight(kernel, order, power, xSize, ySize, dy, dx):
+  if dy==0 and dx==0:
+    return 0.0
+  if kernel=="Rook":
+    return float(abs(dy)+abs(dx)==1)
+  if kernel=="Queen":
+    return float(max(abs(dy), abs(dx))==1)
+  if kernel=="K-order":
+    return float(abs(dy)+abs(dx)<=order)
+  if kernel=="Inverse distance" and hypot(dy, dx)<=order:
+    return 1.0/hypot(dy*ySize, dx*xSize)**power
+  return 0.0
+
+################################################################
+# n x n weights matrix of the pixels with data, in row order
+def weightsMatrix(mask, weights, rowStandardise):
+  myPixels=zip(*nonzero(mask))
+  W=zeros((len(myPixels), len(myPixels)))
+  for i, [yi, xi] in enumerate(myPixels):
+    for j, [yj, xj] in enumerate(myPixels):
+      W[i,j]=pairWeight(*(weights+[yj-yi, xj-xi]))
+  if rowStandardise:
+    myRowSum=W.sum(axis=1)
+    W[myRowSum>0]/=myRowSum[myRowSum>0][:,None]
+  return W
+
+################################################################
+# the sums of moranGearySums worked out pixel pair by pixel pair
+def bruteSums(values, mask, m, W):
+  d=values[mask]-m
+  myRowSum=W.sum(axis=1)
+  myColSum=W.sum(axis=0)
+  return [len(d), (d*d).sum(), (d**4).sum(), d.dot(W.dot(d)),
+          (W*(d[:,None]-d[None,:])**2).sum(), W.sum(), ((W+W.T)**2).sum()/2,
+          ((myRowSum+myColSum)**2).sum()]
+
+################################################################
+# moranGearySums over strips of rows with their halo, added together
+def stripSums(values, mask, m, stencil, rowStandardise, rows):
+  myHalo=stencilHalo(stencil, rowStandardise)
+  mySums=None
+  for yStart in range(0, len(values), rows):
+    yStop=min(yStart+rows, len(values))
+    [myLow, myHigh]=[max(0, yStart-myHalo), min(len(values), yStop+myHalo)]
+    myStripSums=moranGearySums(values[myLow:myHigh], mask[myLow:myHigh], m,
+                               yStart-myLow, yStop-myLow, stencil, rowStandardise)
+    if mySums is None:
+      mySums=myStripSums
+    else:
+      mySums=addSums(mySums, myStripSums)
+  return mySums
+
+################################################################
+class moranGearyTest(unittest.TestCase):
+
+  def setUp(self):
+    myRandom=RandomState(3)
+    self.values=myRandom.randn(13, 11)+(myRandom.rand(13, 11)>0.5)
+    self.mask=myRandom.rand(13, 11)>0.2
+    # an isolated pixel with no neighbours for Rook
+    self.mask[0,:3]=[True, False, False]
+    self.mask[1,:2]=False
+    self.m=self.values[self.mask].mean()
+
+  def assertSums(self, mySums, myExpected, msg):
+    self.assertEqual(mySums[0], myExpected[0], msg)
+    for [mySum, myExpectedSum] in zip(mySums[1:], myExpected[1:]):
+      self.assertAlmostEqual(mySum, myExpectedSum, delta=1e-9*max(1.0, abs(myExpectedSum)),
+                             msg=msg)
+
+  def testStencils(self):
+    # the stencil holds exactly the non-zero weights of each kernel
+    for myWeights in Kernels:
+      myStencil=makeStencil(*myWeights)
+      [kernel, order]=myWeights[:2]
+      for dy in range(-order-1, order+2):
+        for dx in range(-order-1, order+2):
+          myFound=[w for [sy, sx, w] in myStencil if [sy, sx]==[dy, dx]]
+          myExpected=pairWeight(*(myWeights+[dy, dx]))
+          if myExpected:
+            self.assertEqual(len(myFound), 1)
+            self.assertAlmostEqual(myFound[0], myExpected)
+          else:
+            self.assertEqual(myFound, [])
+
+  def testSums(self):
+    # one block and strips of several sizes, with and without row
+    # standardising, against the whole weights matrix
+    for myWeights in Kernels:
+      myStencil=makeStencil(*myWeights)
+      for myRowStandardise in [False, True]:
+        myMsg="%s %s" %(myWeights, myRowStandardise)
+        myExpected=bruteSums(self.values, self.mask, self.m,
+                             weightsMatrix(self.mask, myWeights, myRowStandardise))
+        self.assertSums(moranGearySums(self.values, self.mask, self.m, stencil=myStencil,
+                                       rowStandardise=myRowStandardise), myExpected, myMsg)
+        for myRows in [1, 2, 5]:
+          self.assertSums(stripSums(self.values, self.mask, self.m, myStencil,
+                                    myRowStandardise, myRows), myExpected, myMsg)
+
+  def testStatistics(self):
+    # Moran's I and Geary's C from the sums, as their textbook formulas
+    W=weightsMatrix(self.mask, Kernels[1], False)
+    d=self.values[self.mask]-self.m
+    myN=len(d)
+    myStats=moranGearyStats(*moranGearySums(self.values, self.mask, self.m,
+                                            stencil=makeStencil(*Kernels[1])))
+    self.assertAlmostEqual(myStats[0], myN*d.dot(W.dot(d))/(W.sum()*(d*d).sum()))
+    self.assertAlmostEqual(myStats[7], (myN-1)*(W*(d[:,None]-d[None,:])**2).sum()/
+                                       (2*W.sum()*(d*d).sum()))
+
+  def testLocal(self):
+    for myWeights in Kernels:
+      myStencil=makeStencil(*myWeights)
+      for myRowStandardise in [False, True]:
+        W=weightsMatrix(self.mask, myWeights, myRowStandardise)
+        d=self.values[self.mask]-self.m
+        myN=len(d)
+        [myDenominator, myKNum]=[(d*d).sum(), (d**4).sum()]
+        myM2=myDenominator/myN
+        myB2=(myKNum/myN)/myM2**2
+        myI=d*W.dot(d)/myM2
+        myWi=W.sum(axis=1)
+        myWi2=(W*W).sum(axis=1)
+        myE=-myWi/(myN-1)
+        myVariance=myWi2*(myN-myB2)/(myN-1) + \
+                   (myWi*myWi-myWi2)*(2*myB2-myN)/((myN-1)*(myN-2)) - myE*myE
+
+        myHalo=stencilHalo(myStencil, myRowStandardise)
+        for myRows in [len(self.values), 3]:
+          for yStart in range(0, len(self.values), myRows):
+            yStop=min(yStart+myRows, len(self.values))
+            [myLow, myHigh]=[max(0, yStart-myHalo), min(len(self.values), yStop+myHalo)]
+            [myStripI, myStripZ, myCluster]=localMoran(
+                self.values[myLow:myHigh], self.mask[myLow:myHigh], self.m, myN,
+                myDenominator, myKNum, yStart-myLow, yStop-myLow, myStencil, myRowStandardise)
+            # the pixels with data in these rows, in matrix order
+            myBefore=self.mask[:yStart].sum()
+            myPixels=slice(myBefore, myBefore+self.mask[yStart:yStop].sum())
+            myStripMask=self.mask[yStart:yStop]
+            self.assertTrue(isnan(myStripI[~myStripMask]).all())
+            self.assertTrue((myCluster[~myStripMask]==0).all())
+            for [myGot, myExpected] in zip(myStripI[myStripMask], myI[myPixels]):
+              self.assertAlmostEqual(myGot, myExpected)
+            for [myGot, myExpectedI, myExpectedE, myExpectedV] in zip(
+                myStripZ[myStripMask], myI[myPixels], myE[myPixels], myVariance[myPixels]):
+              if myExpectedV>0:
+                self.assertAlmostEqual(myGot, (myExpectedI-myExpectedE)/sqrt(myExpectedV))
+              else:
+                self.assertTrue(isnan(myGot))
+
+  def testConstant(self):
+    # no variation: no statistics, an empty local Moran's I, not an error
+    myValues=full((10, 10), 4.0)
+    for myMask in [full((10, 10), True), full((10, 10), False)]:
+      myN=int(myMask.sum())
+      mySums=moranGearySums(myValues, myMask, 4.0)
+      self.assertEqual(mySums[1], 0.0)
+      self.assertEqual(moranGearyStats(*mySums), [None]*14)
+      [myI, myZ, myCluster]=localMoran(myValues, myMask, 4.0, myN, 0.0, 0.0)
+      self.assertTrue(isnan(myI).all())
+      self.assertTrue(isnan(myZ).all())
+      self.assertTrue((myCluster==0).all())
+
+if __name__=="__main__":
+  unittest.main()
@@ -0,0 +1,107 @@
+"""
+/***************************************************************************
+test_PseudoPoints
+Tests for the distance functions of the PseudoDist plugin, run from the
+plugin directory with
+  python -m unittest discover -s tests
+                             -------------------
+begin                : 2011-01-10
+copyright            : (C) 2011 by Chris Yesson
+email                : chris.yesson@ioz.ac.uk
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import os
+import sys
+import unittest
+from numpy import array, hypot
+
+# the cores are Qt-free, so can be imported straight from their folders
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "PseudoDist"))
+from PseudoPoints import ellipsoidDistance, planarDistance
+
+################################################################
+# [lon1, lat1, lon2, lat2, metres] on WGS84, as given by Vincenty's
+# inverse formula (QgsDistanceArea measureLine) and the geodesic of
+# Karney (2013), which agree to well under a millimetre here
+Reference=[
+  # equatorial, 1 degree of longitude
+  [0.0, 0.0, 1.0, 0.0, 111319.4908],
+  # meridional, 1 degree of latitude from the equator
+  [0.0, 0.0, 0.0, 1.0, 110574.3886],
+  # quarter meridian, equator to pole
+  [0.0, 0.0, 0.0, 90.0, 10001965.7293],
+  # pole to pole
+  [0.0, -90.0, 0.0, 90.0, 20003931.4586],
+  # over the pole
+  [0.0, 80.0, 180.0, 80.0, 2233651.7148],
+  [0.0, 89.0, 90.0, 89.0, 157954.9686],
+  # short lines
+  [0.0, 0.0, 0.00001, 0.0, 1.1132],
+  [-0.1, 51.5, -0.1001, 51.5001, 13.1150],
+  # Flinders Peak to Buninyong, the example of Vincenty (1975)
+  [144.42486788889, -37.95103341667, 143.92649552778, -37.65282113889, 54972.2711],
+  # long line across the date line
+  [-73.7781, 40.6413, 139.7798, 35.5494, 10899319.8938]]
+
+# agreement asked of ellipsoidDistance, metres
+Tolerance=0.001
+
+################################################################
+class ellipsoidDistanceTest(unittest.TestCase):
+
+  def testReference(self):
+    for [x1, y1, x2, y2, myDistance] in Reference:
+      self.assertAlmostEqual(float(ellipsoidDistance(x1, y1, x2, y2)), myDistance,
+                             delta=Tolerance, msg="%s,%s to %s,%s" %(x1, y1, x2, y2))
+
+  def testArrays(self):
+    # all the pairs at once give the same as one at a time
+    myPairs=array(Reference)
+    myDistances=ellipsoidDistance(myPairs[:,0], myPairs[:,1], myPairs[:,2], myPairs[:,3])
+    for myDistance, myExpected in zip(myDistances, myPairs[:,4]):
+      self.assertAlmostEqual(myDistance, myExpected, delta=Tolerance)
+
+  def testOrigin(self):
+    # one point against many, as used for the point of origin
+    myPairs=array(Reference)
+    myDistances=ellipsoidDistance(0.0, 0.0, myPairs[:3,2], myPairs[:3,3])
+    for myDistance, myExpected in zip(myDistances, myPairs[:3,4]):
+      self.assertAlmostEqual(myDistance, myExpected, delta=Tolerance)
+
+  def testSymmetric(self):
+    for [x1, y1, x2, y2, myDistance] in Reference:
+      self.assertAlmostEqual(float(ellipsoidDistance(x2, y2, x1, y1)), myDistance,
+                             delta=Tolerance)
+
+  def testSamePoint(self):
+    self.assertEqual(float(ellipsoidDistance(12.5, -41.0, 12.5, -41.0)), 0.0)
+
+################################################################
+class planarDistanceTest(unittest.TestCase):
+
+  def testHypot(self):
+    # straight lines in map units, whatever the units are
+    x1=array([0.0, 3.0, -250000.0, 1.5])
+    y1=array([0.0, 4.0, 6200000.0, -2.0])
+    x2=array([3.0, 0.0, 125000.0, 1.5])
+    y2=array([4.0, 0.0, 6100000.0, -2.0])
+    myDistances=planarDistance(x1, y1, x2, y2)
+    self.assertEqual(list(myDistances), list(hypot(x2-x1, y2-y1)))
+    self.assertEqual(float(myDistances[0]), 5.0)
+    self.assertEqual(float(myDistances[3]), 0.0)
+
+  def testSinglePoints(self):
+    self.assertEqual(float(planarDistance(1.0, 1.0, 4.0, 5.0)), 5.0)
+
+if __name__=="__main__":
+  unittest.main()